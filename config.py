@@ -5,13 +5,24 @@
 支持从 YAML 文件读取配置，并与默认配置合并。
 """
 
+import copy
+import functools
+import hashlib
+import json
 import os
-from typing import Dict, Any
+import stat
+import types
+from typing import Dict, Any, Mapping, Optional
 import yaml
 
+# 优先使用 libyaml 的 C 实现，不可用时回退到纯 Python 实现
+try:
+    from yaml import CSafeLoader as _Loader, CSafeDumper as _Dumper
+except ImportError:
+    from yaml import SafeLoader as _Loader, SafeDumper as _Dumper
 
-# 默认配置
-DEFAULT_CONFIG = {
+# 默认配置（原始字典，仅在模块内部使用，不得修改）
+_DEFAULT_CONFIG = {
     'mqtt': {
         'broker': 'localhost',
         'port': 1883,
@@ -19,6 +30,7 @@ DEFAULT_CONFIG = {
         'password': '',
         'client_id_prefix': 'fmo_repeater',
         'keepalive': 60,
+        'socket_path': '',  # 非空时通过 UNIX 域套接字连接，忽略 broker 和 port
     },
     'topics': {
         'subscribe': 'FMO/RAW',
@@ -28,6 +40,8 @@ DEFAULT_CONFIG = {
         'timeout': 5.0,  # 秒
         'uid': 65535,
         'callsign_prefix': 'RE>',
+        'max_buffer': 10000,  # 最大缓存消息数
+        'blocked_uids': [],  # 额外忽略的 UID 列表（Echo UID 始终被忽略）
     },
     'logging': {
         'level': 'INFO',
@@ -43,10 +57,43 @@ DEFAULT_CONFIG = {
 }
 
 
-def deep_merge(base: Dict, override: Dict) -> Dict:
+def _freeze(value: Any) -> Any:
+    """递归地将字典包装为只读的 MappingProxyType"""
+    if isinstance(value, dict):
+        return types.MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    return value
+
+
+# 只读的默认配置，防止调用方意外修改；需要可修改的副本时使用 default_config()
+# （MappingProxyType 不支持 copy.deepcopy）
+DEFAULT_CONFIG: Mapping[str, Any] = _freeze(_DEFAULT_CONFIG)
+
+
+def default_config() -> Dict[str, Any]:
+    """
+    获取默认配置的独立副本
+
+    Returns:
+        Dict: 可自由修改的默认配置字典
+    """
+    return copy.deepcopy(_DEFAULT_CONFIG)
+
+
+def _thaw(value: Any) -> Any:
+    """递归地将映射（包括只读的 MappingProxyType）复制为普通字典，其余值深拷贝"""
+    if isinstance(value, Mapping):
+        return {k: _thaw(v) for k, v in value.items()}
+    return copy.deepcopy(value)
+
+
+def deep_merge(base: Mapping, override: Mapping) -> Dict:
     """
     深度合并两个字典，override 中的值会覆盖 base 中的对应值
 
+    入口处将 base 复制为普通字典（只读的 DEFAULT_CONFIG 也可作为 base），
+    之后在副本上原地合并，因此返回的新字典不会与 base 共享任何可变对象，
+    base 本身也不会被修改。
+
     Args:
         base: 基础字典
         override: 覆盖字典
@@ -54,25 +101,123 @@ def deep_merge(base: Dict, override: Dict) -> Dict:
     Returns:
         Dict: 合并后的新字典
     """
-    result = base.copy()
-
-    for key, value in override.items():
-        if key in result and isinstance(result[key], dict) and isinstance(value, dict):
-            # 递归合并嵌套字典
-            result[key] = deep_merge(result[key], value)
-        else:
-            # 直接覆盖
-            result[key] = value
+    result = _thaw(base)
+
+    # 使用显式栈代替递归，在副本上原地合并嵌套字典
+    stack = [(result, override)]
+    while stack:
+        target, source = stack.pop()
+        for key, value in source.items():
+            current = target.get(key)
+            if isinstance(current, dict) and isinstance(value, Mapping):
+                # 两侧均为字典：继续合并
+                stack.append((current, value))
+            else:
+                # 直接覆盖
+                target[key] = value
 
     return result
 
 
+# 配置解析结果旁路缓存文件的后缀，位于配置文件同目录
+_SIDECAR_SUFFIX = '.cache'
+
+# 旁路缓存文件首行的版本标记前缀
+_SIDECAR_HEADER = '# content-version: '
+
+
+def _read_config_sidecar(path: str, version: str) -> Optional[Dict[str, Any]]:
+    """
+    读取配置文件的旁路缓存
+
+    Args:
+        path: 配置文件路径
+        version: 期望的内容版本标记
+
+    Returns:
+        Dict: 缓存的解析结果；缓存不存在、版本不匹配或内容损坏时返回 None
+    """
+    try:
+        with open(path + _SIDECAR_SUFFIX, 'r', encoding='utf-8') as f:
+            if f.readline().rstrip('\n') != _SIDECAR_HEADER + version:
+                return None
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_config_sidecar(path: str, version: str, data: Dict[str, Any]):
+    """
+    写入配置文件的旁路缓存
+
+    只缓存能够通过 JSON 无损往返的内容；写入失败（如目录只读）时静默跳过。
+    缓存中含有密码等配置，文件权限与配置文件保持一致，不受默认 umask 放宽。
+
+    Args:
+        path: 配置文件路径
+        version: 内容版本标记
+        data: 解析得到的用户配置
+    """
+    try:
+        body = json.dumps(data, ensure_ascii=False)
+        if json.loads(body) != data:
+            return
+
+        sidecar = path + _SIDECAR_SUFFIX
+        temp = f"{sidecar}.{os.getpid()}.tmp"
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+        fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode)
+        try:
+            with open(fd, 'w', encoding='utf-8') as f:
+                f.write(f"{_SIDECAR_HEADER}{version}\n{body}")
+            os.replace(temp, sidecar)
+        except OSError:
+            os.unlink(temp)
+            raise
+    except (OSError, TypeError, ValueError):
+        pass
+
+
+@functools.lru_cache(maxsize=32)
+def _parse_config_file(path: str, mtime_ns: int, size: int) -> Optional[Dict[str, Any]]:
+    """
+    解析 YAML 配置文件
+
+    结果按 (路径, 修改时间, 文件大小) 缓存，文件变化后键随之改变，缓存自动失效。
+    解析结果同时以 JSON 形式写入配置文件旁的 `.cache` 文件，首行记录内容版本
+    （路径、修改时间和大小的 MD5），进程重启后版本匹配即可跳过 YAML 解析。
+    调用方不得修改返回值。
+
+    Args:
+        path: 配置文件绝对路径
+        mtime_ns: 文件修改时间（纳秒）
+        size: 文件大小（字节）
+
+    Returns:
+        Dict: 解析得到的用户配置，文件为空时返回 None
+    """
+    version = hashlib.md5(f"{path}:{mtime_ns}:{size}".encode('utf-8')).hexdigest()
+
+    cached = _read_config_sidecar(path, version)
+    if cached is not None:
+        return cached
+
+    with open(path, 'r', encoding='utf-8') as f:
+        user_config = yaml.load(f, Loader=_Loader)
+
+    if user_config:
+        _write_config_sidecar(path, version, user_config)
+
+    return user_config
+
+
 def load_config(config_file: str = 'config.yaml') -> Dict[str, Any]:
     """
     从 YAML 文件加载配置
 
     首先加载默认配置，然后从指定的 YAML 文件读取用户配置并合并。
     如果文件不存在，返回默认配置。
+    文件解析结果会被缓存，文件未变化时不再重复解析。
 
     Args:
         config_file: 配置文件路径（默认为 config.yaml）
@@ -85,18 +230,21 @@ def load_config(config_file: str = 'config.yaml') -> Dict[str, Any]:
         IOError: 文件读取错误
     """
     # 从默认配置开始
-    config = DEFAULT_CONFIG.copy()
+    config = default_config()
 
     # 如果配置文件存在，读取并合并
     if os.path.exists(config_file):
         try:
-            with open(config_file, 'r', encoding='utf-8') as f:
-                user_config = yaml.safe_load(f)
-                if user_config:  # 确保文件不为空
-                    config = deep_merge(config, user_config)
-                    print(f"已加载配置文件: {config_file}")
-                else:
-                    print(f"配置文件为空，使用默认配置: {config_file}")
+            file_stat = os.stat(config_file)
+            user_config = _parse_config_file(
+                os.path.abspath(config_file), file_stat.st_mtime_ns, file_stat.st_size
+            )
+            if user_config:  # 确保文件不为空
+                # 复制缓存的解析结果，避免合并后的配置与缓存共享可变对象
+                config = deep_merge(_DEFAULT_CONFIG, copy.deepcopy(user_config))
+                print(f"已加载配置文件: {config_file}")
+            else:
+                print(f"配置文件为空，使用默认配置: {config_file}")
         except yaml.YAMLError as e:
             raise yaml.YAMLError(f"配置文件格式错误: {e}")
         except IOError as e:
@@ -107,7 +255,12 @@ def load_config(config_file: str = 'config.yaml') -> Dict[str, Any]:
     return config
 
 
-def validate_config(config: Dict[str, Any]) -> bool:
+def _is_int(value: Any) -> bool:
+    """判断是否为整数（排除 bool，YAML 中的 true/false 不能当作 1/0 使用）"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def validate_config(config: Mapping[str, Any]) -> bool:
     """
     验证配置的完整性和合理性
 
@@ -128,10 +281,14 @@ def validate_config(config: Dict[str, Any]) -> bool:
 
     # 检查 MQTT 配置
     mqtt = config['mqtt']
-    if not mqtt.get('broker'):
-        raise ValueError("MQTT broker 地址不能为空")
-    if not isinstance(mqtt.get('port'), int) or not (1 <= mqtt['port'] <= 65535):
-        raise ValueError("MQTT port 必须是 1-65535 之间的整数")
+    socket_path = mqtt.get('socket_path')
+    if socket_path is not None and not isinstance(socket_path, str):
+        raise ValueError("MQTT socket_path 必须是字符串")
+    if not socket_path:
+        if not mqtt.get('broker'):
+            raise ValueError("MQTT broker 地址不能为空")
+        if not _is_int(mqtt.get('port')) or not (1 <= mqtt['port'] <= 65535):
+            raise ValueError("MQTT port 必须是 1-65535 之间的整数")
 
     # 检查主题配置
     topics = config['topics']
@@ -144,10 +301,18 @@ def validate_config(config: Dict[str, Any]) -> bool:
     echo = config['echo']
     if not isinstance(echo.get('timeout'), (int, float)) or echo['timeout'] <= 0:
         raise ValueError("Echo 超时时间必须是大于 0 的数值")
-    if not isinstance(echo.get('uid'), int) or not (0 <= echo['uid'] <= 65535):
+    if not _is_int(echo.get('uid')) or not (0 <= echo['uid'] <= 65535):
         raise ValueError("Echo UID 必须是 0-65535 之间的整数")
     if not isinstance(echo.get('callsign_prefix'), str):
         raise ValueError("呼号前缀必须是字符串")
+    max_buffer = echo.get('max_buffer', 10000)
+    if not _is_int(max_buffer) or max_buffer <= 0:
+        raise ValueError("最大缓存消息数必须是大于 0 的整数")
+    blocked_uids = echo.get('blocked_uids', [])
+    if not isinstance(blocked_uids, list) or not all(
+        _is_int(uid) and 0 <= uid <= 65535 for uid in blocked_uids
+    ):
+        raise ValueError("屏蔽 UID 列表必须是 0-65535 之间整数的列表")
 
     # 检查日志配置
     logging_config = config['logging']
@@ -169,7 +334,7 @@ def save_default_config(config_file: str = 'config.yaml'):
     """
     try:
         with open(config_file, 'w', encoding='utf-8') as f:
-            yaml.dump(DEFAULT_CONFIG, f, default_flow_style=False, allow_unicode=True)
+            yaml.dump(_DEFAULT_CONFIG, f, Dumper=_Dumper, default_flow_style=False, allow_unicode=True)
         print(f"默认配置已保存到: {config_file}")
     except IOError as e:
         raise IOError(f"无法写入配置文件: {e}")
@@ -6,6 +6,27 @@ FMO 数据包由 22 字节固定头部和可变长度载荷组成。
 """
 
 import struct
+from typing import Union
+
+
+# 预编译的头部结构：小端序 (<)，uint32 + 3×uint16 + 12字节字符串
+_HEADER_STRUCT = struct.Struct("<IHHH12s")
+
+# 预编译的单字段结构：小端序 uint32 / uint16
+_UINT32_STRUCT = struct.Struct("<I")
+_UINT16_STRUCT = struct.Struct("<H")
+
+
+def _pad_callsign(callsign: bytes) -> bytes:
+    """将呼号字节截断至 12 字节，不足时右侧填充空字节"""
+    return callsign[:FMORawHeader.CALLSIGN_SIZE].ljust(FMORawHeader.CALLSIGN_SIZE, b'\x00')
+
+
+def _encode_callsign(callsign: Union[str, bytes]) -> bytes:
+    """将呼号编码为 UTF-8（已是字节时直接使用），截断至 12 字节，不足时右侧填充空字节"""
+    if isinstance(callsign, (bytes, bytearray)):
+        return _pad_callsign(bytes(callsign))
+    return _pad_callsign(callsign.encode('utf-8'))
 
 
 class FMORawHeader:
@@ -22,6 +43,10 @@ class FMORawHeader:
     所有字段使用小端字节序（little-endian）。
     """
 
+    # 使用 __slots__ 省去实例 __dict__，减少内存占用并加快属性访问
+    # 呼号同时保存解码后的字符串和 12 字节原始编码，两者按需互相转换并缓存，至少一个不为 None
+    __slots__ = ('version', 'uid', '_callsign', '_callsign_raw', 'padding1', 'padding2')
+
     # 字段大小常量（单位：字节）
     VERSION_SIZE = 4
     UID_SIZE = 2
@@ -32,14 +57,21 @@ class FMORawHeader:
     # 头部总大小：22 字节
     HEADER_SIZE = VERSION_SIZE + PADDING_SIZE_1 + UID_SIZE + PADDING_SIZE_2 + CALLSIGN_SIZE
 
-    def __init__(self, version: int, uid: int, callsign: str, padding1: int = 0, padding2: int = 0):
+    # 字段在头部中的偏移量（单位：字节）
+    VERSION_OFFSET = 0
+    PADDING1_OFFSET = VERSION_OFFSET + VERSION_SIZE
+    UID_OFFSET = PADDING1_OFFSET + PADDING_SIZE_1
+    PADDING2_OFFSET = UID_OFFSET + UID_SIZE
+    CALLSIGN_OFFSET = PADDING2_OFFSET + PADDING_SIZE_2
+
+    def __init__(self, version: int, uid: int, callsign: Union[str, bytes], padding1: int = 0, padding2: int = 0):
         """
         初始化 FMO 头部对象
 
         Args:
             version: 协议版本号
             uid: 用户/设备唯一标识符
-            callsign: 无线电呼号（最多 12 字节 UTF-8 编码）
+            callsign: 无线电呼号（字符串或原始字节，最多 12 字节 UTF-8 编码）
             padding1: 第一个填充字段（默认为 0）
             padding2: 第二个填充字段（默认为 0）
         """
@@ -49,6 +81,40 @@ class FMORawHeader:
         self.padding1 = padding1
         self.padding2 = padding2
 
+    @property
+    def callsign(self) -> str:
+        """无线电呼号（首次访问时从原始字节解码并缓存）"""
+        callsign = self._callsign
+        if callsign is None:
+            # 移除尾部空字节并解码为 UTF-8 字符串，错误时使用替换字符
+            callsign = self._callsign_raw.rstrip(b'\x00').decode('utf-8', errors='replace')
+            self._callsign = callsign
+        return callsign
+
+    @callsign.setter
+    def callsign(self, value: Union[str, bytes]):
+        # 修改呼号时使另一种表示的缓存失效
+        if isinstance(value, (bytes, bytearray)):
+            self._callsign = None
+            self._callsign_raw = _pad_callsign(bytes(value))
+        else:
+            self._callsign = value
+            self._callsign_raw = None
+
+    @property
+    def callsign_raw(self) -> bytes:
+        """
+        12 字节的呼号原始编码（结果缓存）
+
+        呼号编码为 UTF-8 并截断至 12 字节，不足时右侧填充空字节。
+        适用于只需原样比较或转发呼号、无需解码的场景。
+        """
+        callsign_raw = self._callsign_raw
+        if callsign_raw is None:
+            callsign_raw = _encode_callsign(self._callsign)
+            self._callsign_raw = callsign_raw
+        return callsign_raw
+
     @classmethod
     def from_bytes(cls, data: bytes) -> 'FMORawHeader':
         """
@@ -68,16 +134,21 @@ class FMORawHeader:
                 f"数据长度不足: 期望至少 {cls.HEADER_SIZE} 字节，实际得到 {len(data)} 字节"
             )
 
-        # 使用 struct 解包：小端序 (<)，uint32 + 3×uint16 + 12字节字符串
-        version, padding1, uid, padding2, callsign_bytes = struct.unpack(
-            "<IHHH12s",
-            data[:cls.HEADER_SIZE]
-        )
+        # 使用预编译的 struct 直接从原缓冲区解包，避免切片复制
+        version, padding1, uid, padding2, callsign_bytes = _HEADER_STRUCT.unpack_from(data, 0)
 
-        # 移除尾部空字节并解码为 UTF-8 字符串，错误时使用替换字符
-        callsign = callsign_bytes.rstrip(b'\x00').decode('utf-8', errors='replace')
+        # 绕过 __init__ 的参数处理，直接为各个 slot 赋值
+        header = cls.__new__(cls)
+        header.version = version
+        header.uid = uid
+        header.padding1 = padding1
+        header.padding2 = padding2
 
-        return cls(version, uid, callsign, padding1, padding2)
+        # 保留呼号原始字节，访问 callsign 时再解码
+        header._callsign = None
+        header._callsign_raw = callsign_bytes
+
+        return header
 
     def to_bytes(self) -> bytes:
         """
@@ -86,20 +157,31 @@ class FMORawHeader:
         Returns:
             bytes: 序列化后的 22 字节数据
         """
-        # 编码呼号为 UTF-8 并截断至 12 字节
-        callsign_encoded = self.callsign.encode('utf-8')[:self.CALLSIGN_SIZE]
+        # 使用 struct 打包为二进制数据
+        return _HEADER_STRUCT.pack(
+            self.version,
+            self.padding1,
+            self.uid,
+            self.padding2,
+            self.callsign_raw
+        )
 
-        # 不足 12 字节时右侧填充空字节
-        callsign_padded = callsign_encoded.ljust(self.CALLSIGN_SIZE, b'\x00')
+    def pack_into(self, buffer: bytearray, offset: int = 0):
+        """
+        将头部对象直接序列化到可写缓冲区中，不产生中间字节对象
 
-        # 使用 struct 打包为二进制数据
-        return struct.pack(
-            "<IHHH12s",
+        Args:
+            buffer: 可写缓冲区（如 bytearray），从 offset 起至少有 22 字节空间
+            offset: 写入起始位置（默认为 0）
+        """
+        _HEADER_STRUCT.pack_into(
+            buffer,
+            offset,
             self.version,
             self.padding1,
             self.uid,
             self.padding2,
-            callsign_padded
+            self.callsign_raw
         )
 
     def __repr__(self) -> str:
@@ -113,27 +195,38 @@ class FMORawHeader:
         )
 
 
-def replace_header_in_stream(stream: bytes, **updates) -> bytes:
+# replace_header_in_stream 支持修改的整数字段：字段名 -> (结构, 偏移量)
+_INT_FIELDS = {
+    'version': (_UINT32_STRUCT, FMORawHeader.VERSION_OFFSET),
+    'padding1': (_UINT16_STRUCT, FMORawHeader.PADDING1_OFFSET),
+    'uid': (_UINT16_STRUCT, FMORawHeader.UID_OFFSET),
+    'padding2': (_UINT16_STRUCT, FMORawHeader.PADDING2_OFFSET),
+}
+
+
+def replace_header_in_stream(stream: bytes, **updates) -> bytearray:
     """
-    从完整数据流中解析头部，修改指定字段，重新序列化头部，保留载荷不变
+    修改完整数据流中头部的指定字段，保留其余字段和载荷不变
 
     这是实现 Echo 服务的核心函数：能够拦截 FMO 数据包，修改头部信息（如 UID 和呼号），
-    同时保留原始的无线电数据载荷。
+    同时保留原始的无线电数据载荷。只有指定的字段会在数据流副本上按偏移量原地改写，
+    不解析、不重新序列化整个头部。
 
     Args:
         stream: 原始完整字节流（至少包含 22 字节头部）
         **updates: 要修改的字段，支持的字段名：
             - version: 协议版本号
             - uid: 用户/设备标识符
-            - callsign: 无线电呼号
+            - callsign: 无线电呼号（str 或已编码的 bytes）
             - padding1: 填充字段1
             - padding2: 填充字段2
 
     Returns:
-        bytes: 新的字节流（修改后的头部 + 原始载荷）
+        bytearray: 新的字节流（修改后的头部 + 原始载荷），可直接用于 MQTT 发布
 
     Raises:
         AttributeError: 如果指定的字段名不存在
+        ValueError: 如果数据长度不足 22 字节
 
     Example:
         >>> original_packet = b'...'  # 22字节头部 + 载荷
@@ -144,20 +237,84 @@ def replace_header_in_stream(stream: bytes, **updates) -> bytes:
         ...     callsign="RE>BD8BOJ"
         ... )
     """
-    # 解析原始头部
-    header = FMORawHeader.from_bytes(stream)
+    # 检查字段名
+    for key in updates:
+        if key != 'callsign' and key not in _INT_FIELDS:
+            raise AttributeError(f"FMORawHeader 没有属性 '{key}'")
+
+    if len(stream) < FMORawHeader.HEADER_SIZE:
+        raise ValueError(
+            f"数据长度不足: 期望至少 {FMORawHeader.HEADER_SIZE} 字节，实际得到 {len(stream)} 字节"
+        )
+
+    # 复制原始数据流，并在原地改写指定字段，载荷只复制一次
+    buf = bytearray(stream)
 
-    # 更新指定的字段
     for key, value in updates.items():
-        if not hasattr(header, key):
-            raise AttributeError(f"FMORawHeader 没有属性 '{key}'")
-        setattr(header, key, value)
+        if key == 'callsign':
+            buf[FMORawHeader.CALLSIGN_OFFSET:FMORawHeader.HEADER_SIZE] = _encode_callsign(value)
+        else:
+            field_struct, offset = _INT_FIELDS[key]
+            field_struct.pack_into(buf, offset, value)
+
+    return buf
+
+
+def peek_uid(stream: bytes) -> int:
+    """
+    直接从数据流中读取 UID，不解析其余字段、不构造 FMORawHeader 对象
+
+    适用于 UID 过滤等只关心 UID 的热路径。调用方需保证数据长度不少于 22 字节。
+
+    Args:
+        stream: 原始字节流
 
-    # 重新序列化头部
-    new_header = header.to_bytes()
+    Returns:
+        int: 用户/设备标识符
+    """
+    return _UINT16_STRUCT.unpack_from(stream, FMORawHeader.UID_OFFSET)[0]
+
+
+def rewrite_uid_callsign(stream: bytes, uid: int, callsign: bytes) -> bytearray:
+    """
+    直接在字节层面修改数据流中的 UID 和呼号，其余头部字段和载荷保持不变
+
+    与 replace_header_in_stream 不同，本函数不解析头部、不构造 FMORawHeader 对象，
+    适用于 Echo 重放等只需修改 UID 和呼号的热路径。
 
-    # 提取原始载荷（跳过前 22 字节的头部）
-    payload = stream[FMORawHeader.HEADER_SIZE:]
+    Args:
+        stream: 原始完整字节流（至少包含 22 字节头部）
+        uid: 新的用户/设备标识符
+        callsign: 新的呼号字节（超过 12 字节时截断，不足时空字节填充）
+
+    Returns:
+        bytearray: 修改头部后的字节流
+
+    Raises:
+        ValueError: 如果数据长度不足 22 字节
+    """
+    buf = bytearray(stream)
+    rewrite_uid_callsign_inplace(buf, uid, callsign)
+
+    return buf
+
+
+def rewrite_uid_callsign_inplace(buf: bytearray, uid: int, callsign: bytes):
+    """
+    在可写缓冲区中原地修改 UID 和呼号，只写入这两个字段，不复制载荷
+
+    Args:
+        buf: 可写缓冲区（如 bytearray），至少包含 22 字节头部
+        uid: 新的用户/设备标识符
+        callsign: 新的呼号字节（超过 12 字节时截断，不足时空字节填充）
+
+    Raises:
+        ValueError: 如果数据长度不足 22 字节
+    """
+    if len(buf) < FMORawHeader.HEADER_SIZE:
+        raise ValueError(
+            f"数据长度不足: 期望至少 {FMORawHeader.HEADER_SIZE} 字节，实际得到 {len(buf)} 字节"
+        )
 
-    # 拼接新头部和原始载荷
-    return new_header + payload
+    _UINT16_STRUCT.pack_into(buf, FMORawHeader.UID_OFFSET, uid)
+    buf[FMORawHeader.CALLSIGN_OFFSET:FMORawHeader.HEADER_SIZE] = _pad_callsign(callsign)
@@ -8,20 +8,45 @@ FMO Repeater 服务核心模块
 - 日志记录和错误处理
 """
 
-import random
+import atexit
+from collections import deque
+import functools
 import time
 import threading
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+import queue
 import os
-from typing import Dict, List, Any
+from typing import Dict, Any
 import signal
 import sys
 
 from paho.mqtt import client as mqtt_client
 import paho.mqtt.enums
 
-from fmo_header import FMORawHeader, replace_header_in_stream
+from fmo_header import FMORawHeader, peek_uid, rewrite_uid_callsign
+
+# 通过 UNIX 域套接字连接时传给 paho 的占位端口（paho 要求端口为正数，实际不使用）
+_UNIX_SOCKET_PORT = 1883
+
+# 当前负责输出 FMORepeater 日志的后台监听线程，同一时间只保留一个
+_active_log_listener = None
+
+
+def _stop_log_listener():
+    """
+    停止当前的日志后台线程，输出队列中剩余的全部日志
+
+    监听线程是守护线程，进程退出时不会等待它；因此在退出时（atexit）也会调用，
+    避免 sys.exit 等未经过 stop() 的退出路径丢失日志。
+    """
+    global _active_log_listener
+    listener, _active_log_listener = _active_log_listener, None
+    if listener is not None:
+        listener.stop()
+
+
+atexit.register(_stop_log_listener)
 
 
 class FMORepeaterService:
@@ -45,18 +70,45 @@ class FMORepeaterService:
         self.config = config
         self.logger = self._setup_logging()
 
-        # 消息缓存
-        self.message_buffer: List[bytes] = []
-        self.last_message_time = None
+        # 缓存调试日志开关，非调试级别时跳过调试信息的构造
+        self._debug_enabled = self.logger.isEnabledFor(logging.DEBUG)
+
+        # 热路径上频繁使用的配置项，初始化时一次性取出
+        self._timeout = float(config['echo']['timeout'])
+        self._timeout_ns = int(self._timeout * 1_000_000_000)  # 整数纳秒，与 time.monotonic_ns() 比较
+        self._publish_topic = config['topics']['publish']
+        self._callsign_prefix = config['echo']['callsign_prefix']
+
+        # Echo UID，重放的消息使用此 UID
+        self._echo_uid = int(config['echo']['uid'])
+
+        # 需要忽略的 UID 集合，始终包含 Echo UID 以避免重放循环
+        self._blocked_uids = frozenset({self._echo_uid, *config['echo'].get('blocked_uids', ())})
+
+        # 重放时使用的呼号前缀字节，预先编码
+        self._prefix_bytes = self._callsign_prefix.encode('utf-8')[:FMORawHeader.CALLSIGN_SIZE]
+
+        # 原始呼号字段 -> 加前缀后的呼号，同一电台的消息通常成批到达，缓存可省去重复拼接
+        self._prefixed_callsign = functools.lru_cache(maxsize=256)(self._build_prefixed_callsign)
+
+        # 消息缓存（有界，超出上限时丢弃最早的消息）
+        self._max_buffer = int(config['echo'].get('max_buffer', 10000))
+        self.message_buffer: deque = deque(maxlen=self._max_buffer)
+        self._deadline = None  # 超时截止时间（time.monotonic_ns），None 表示无缓存消息
+        self._dropped = 0  # 本轮缓存已满时被挤出的最早消息数
         self.buffer_lock = threading.Lock()  # 线程安全锁
 
         # MQTT 客户端
         self.mqtt_client = None
+        self._broker_address = None  # 代理地址描述，用于日志输出
         self.connected = False
+        self._connected_event = threading.Event()  # 连接建立时置位，供 wait_connected 等待
 
         # 运行状态
         self.running = False
-        self.check_interval = 0.1  # 主循环检查间隔（秒）
+        self._wake = threading.Event()  # 新消息到达或服务停止时唤醒主循环
+        self._replay_done = threading.Event()  # 每完成一次重放后置位，供测试等待重放完成
+        self._message_cached = threading.Event()  # 每缓存一个消息后置位，供测试等待消息缓存
 
         # 注册信号处理器以优雅关闭
         signal.signal(signal.SIGINT, self._signal_handler)
@@ -71,14 +123,19 @@ class FMORepeaterService:
         """
         配置日志系统
 
+        日志记录器只挂载 QueueHandler，实际的控制台和文件输出由后台
+        QueueListener 线程完成，避免 MQTT 回调线程被磁盘 I/O 阻塞。
+
         Returns:
             logging.Logger: 配置好的日志记录器
         """
         logger = logging.getLogger('FMORepeater')
         logger.setLevel(getattr(logging, self.config['logging']['level']))
 
-        # 清除已有的处理器
+        # 清除已有的处理器，并停止之前实例的日志后台线程（先输出其队列中的日志）
         logger.handlers.clear()
+        _stop_log_listener()
+        handlers = []
 
         # 格式化器
         formatter = logging.Formatter(
@@ -90,7 +147,7 @@ class FMORepeaterService:
         if self.config['logging']['console']:
             console_handler = logging.StreamHandler()
             console_handler.setFormatter(formatter)
-            logger.addHandler(console_handler)
+            handlers.append(console_handler)
 
         # 文件处理器
         log_file = self.config['logging']['file']
@@ -107,7 +164,17 @@ class FMORepeaterService:
                 encoding='utf-8'
             )
             file_handler.setFormatter(formatter)
-            logger.addHandler(file_handler)
+            handlers.append(file_handler)
+
+        # 通过队列将日志输出转移到后台线程
+        global _active_log_listener
+        self._log_listener = None
+        if handlers:
+            log_queue = queue.Queue(-1)
+            logger.addHandler(QueueHandler(log_queue))
+            self._log_listener = QueueListener(log_queue, *handlers)
+            self._log_listener.start()
+            _active_log_listener = self._log_listener
 
         return logger
 
@@ -135,7 +202,8 @@ class FMORepeaterService:
         """
         if reason_code == 0:
             self.connected = True
-            self.logger.info(f"已连接到 MQTT 代理: {self.config['mqtt']['broker']}:{self.config['mqtt']['port']}")
+            self._connected_event.set()
+            self.logger.info(f"已连接到 MQTT 代理: {self._broker_address}")
 
             # 订阅主题
             subscribe_topic = self.config['topics']['subscribe']
@@ -143,6 +211,7 @@ class FMORepeaterService:
             self.logger.info(f"已订阅主题: {subscribe_topic}, 结果: {result}")
         else:
             self.connected = False
+            self._connected_event.clear()
             self.logger.error(f"连接 MQTT 代理失败，返回码: {reason_code}")
 
     def _on_disconnect(self, client, userdata, disconnect_flags, reason_code, properties):
@@ -157,6 +226,7 @@ class FMORepeaterService:
             properties: 断开连接属性
         """
         self.connected = False
+        self._connected_event.clear()
         if reason_code == 0:
             self.logger.info("已主动断开 MQTT 连接")
         else:
@@ -164,55 +234,115 @@ class FMORepeaterService:
 
     def _on_message(self, client, userdata, msg):
         """
-        MQTT 消息接收回调
-
-        接收到消息时：
-        1. 解析消息头部获取信息
-        2. 检查 UID，忽略自己重放的消息（避免循环）
-        3. 将消息添加到缓存
-        4. 重置超时计时器
+        MQTT 消息接收回调，取出消息内容交给 _on_payload 处理
 
         Args:
             client: MQTT 客户端实例
             userdata: 用户数据
             msg: 接收到的消息
         """
-        try:
-            # 解析头部以获取呼号和 UID
-            header = FMORawHeader.from_bytes(msg.payload)
+        self._on_payload(msg.payload)
 
-            # 检查 UID，忽略自己重放的消息（避免重放循环）
-            if header.uid == self.config['echo']['uid']:
-                self.logger.debug(
-                    f"忽略自己重放的消息 - UID={header.uid}, 呼号='{header.callsign}'"
+    def _on_payload(self, payload: bytes):
+        """
+        处理接收到的消息内容
+
+        1. 检查消息长度是否足以包含头部
+        2. 用 peek_uid 读取 UID 并在屏蔽集合中查找，忽略自己重放的消息（避免循环）和其他被屏蔽的 UID
+        3. 将消息添加到缓存
+        4. 重置超时计时器
+
+        Args:
+            payload: 接收到的完整消息
+        """
+        try:
+            if len(payload) < FMORawHeader.HEADER_SIZE:
+                self.logger.error(
+                    f"消息长度不足: 期望至少 {FMORawHeader.HEADER_SIZE} 字节，实际得到 {len(payload)} 字节"
                 )
                 return
 
-            # 线程安全地添加消息到缓存
-            with self.buffer_lock:
-                self.message_buffer.append(msg.payload)
-                self.last_message_time = time.time()
+            # 检查 UID，忽略自己重放的消息（避免重放循环）和被屏蔽的 UID
+            # 无需解析完整头部，只读取 UID 字段后查找集合
+            uid = peek_uid(payload)
+            if uid in self._blocked_uids:
+                if self._debug_enabled:
+                    self.logger.debug(f"忽略被屏蔽 UID 的消息 - UID={uid}")
+                return
 
-            self.logger.debug(
-                f"接收到消息 [缓存大小: {len(self.message_buffer)}] - "
-                f"UID={header.uid}, 呼号='{header.callsign}', "
-                f"载荷大小={len(msg.payload)} 字节"
-            )
+            self._append_raw(payload)
+
+            if self._debug_enabled:
+                # 仅在调试时解析头部用于日志输出
+                header = FMORawHeader.from_bytes(payload)
+                self.logger.debug(
+                    f"接收到消息 [缓存大小: {len(self.message_buffer)}] - "
+                    f"UID={header.uid}, 呼号='{header.callsign}', "
+                    f"载荷大小={len(payload)} 字节"
+                )
 
         except Exception as e:
             self.logger.error(f"处理接收消息时出错: {e}", exc_info=True)
 
+    def _append_raw(self, payload: bytes):
+        """
+        将已通过检查的消息添加到缓存并重置超时计时器（线程安全）
+
+        Args:
+            payload: 完整消息（调用方已检查长度和 UID）
+        """
+        with self.buffer_lock:
+            was_idle = self._deadline is None
+            if len(self.message_buffer) == self._max_buffer:
+                # 缓存已满，追加会挤出最早的消息
+                self._dropped += 1
+            self.message_buffer.append(payload)
+            self._deadline = time.monotonic_ns() + self._timeout_ns
+
+        # 缓存由空变为非空时唤醒主循环，开始计时
+        if was_idle:
+            self._wake.set()
+        self._message_cached.set()
+
+    def wait_connected(self, timeout: float) -> bool:
+        """
+        等待 MQTT 连接建立
+
+        Args:
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            bool: 超时前连接已建立返回 True，否则返回 False
+        """
+        return self._connected_event.wait(timeout)
+
     def connect(self):
         """
         连接到 MQTT 代理并订阅主题
         """
+        mqtt_config = self.config['mqtt']
+
         # 生成客户端 ID
-        client_id = f"{self.config['mqtt']['client_id_prefix']}_{random.randint(0, 10000)}"
+        client_id = f"{mqtt_config['client_id_prefix']}_{os.urandom(2).hex()}"
+
+        # 配置了 socket_path 时通过 UNIX 域套接字连接本机代理，省去 TCP 协议栈开销
+        socket_path = mqtt_config.get('socket_path')
+        if socket_path:
+            transport = 'unix'
+            # UNIX 域套接字不使用端口，但 paho 要求端口为正数，传入固定的占位值，
+            # 配置中的 port 被忽略（验证时也不检查）
+            host, port = socket_path, _UNIX_SOCKET_PORT
+            self._broker_address = f"unix:{socket_path}"
+        else:
+            transport = 'tcp'
+            host, port = mqtt_config['broker'], mqtt_config['port']
+            self._broker_address = f"{host}:{port}"
 
         # 创建 MQTT 客户端
         self.mqtt_client = mqtt_client.Client(
             paho.mqtt.enums.CallbackAPIVersion.VERSION2,
-            client_id
+            client_id,
+            transport=transport
         )
 
         # 设置回调
@@ -221,23 +351,17 @@ class FMORepeaterService:
         self.mqtt_client.on_message = self._on_message
 
         # 设置用户名和密码
-        if self.config['mqtt']['username']:
+        if mqtt_config['username']:
             self.mqtt_client.username_pw_set(
-                self.config['mqtt']['username'],
-                self.config['mqtt']['password']
+                mqtt_config['username'],
+                mqtt_config['password']
             )
 
         # 连接到代理
-        self.logger.info(
-            f"正在连接到 MQTT 代理: {self.config['mqtt']['broker']}:{self.config['mqtt']['port']}"
-        )
+        self.logger.info(f"正在连接到 MQTT 代理: {self._broker_address}")
 
         try:
-            self.mqtt_client.connect(
-                self.config['mqtt']['broker'],
-                self.config['mqtt']['port'],
-                self.config['mqtt']['keepalive']
-            )
+            self.mqtt_client.connect(host, port, mqtt_config['keepalive'])
 
             # 启动网络循环线程
             self.mqtt_client.loop_start()
@@ -251,64 +375,111 @@ class FMORepeaterService:
         检查是否超时
 
         如果自上次消息后超过配置的超时时间，且缓存中有消息，则触发重放。
+        缓存在锁内取出并重置，发布在锁外进行，避免阻塞消息接收回调。
         """
         with self.buffer_lock:
             # 如果从未收到消息，直接返回
-            if self.last_message_time is None:
+            if self._deadline is None:
                 return
 
             # 检查是否超时
-            elapsed = time.time() - self.last_message_time
-            if elapsed > self.config['echo']['timeout']:
-                # 只有在缓存不为空时才重放
-                if self.message_buffer:
-                    self.logger.info(
-                        f"检测到超时（{elapsed:.2f}秒），开始重放 {len(self.message_buffer)} 个消息"
-                    )
-                    self._replay_messages()
+            now = time.monotonic_ns()
+            if now < self._deadline:
+                return
+            elapsed = (now - self._deadline + self._timeout_ns) / 1_000_000_000
+
+            # 取出缓存并重置状态
+            buffer = self.message_buffer
+            dropped = self._dropped
+            self.message_buffer = deque(maxlen=self._max_buffer)
+            self._deadline = None
+            self._dropped = 0
+
+        # 只有在缓存不为空时才重放
+        if buffer:
+            if dropped:
+                self.logger.warning(f"缓存已达上限 {self._max_buffer}，丢弃了 {dropped} 个较早的消息")
+            self.logger.info(
+                f"检测到超时（{elapsed:.2f}秒），开始重放 {len(buffer)} 个消息"
+            )
+            self._replay_messages(buffer)
+            self._replay_done.set()
+
+    def _fast_rewrite(self, payload: bytes) -> bytearray:
+        """
+        直接在字节层面重写消息头部，不构造 FMORawHeader 对象
 
-                # 重置状态
-                self.message_buffer = []
-                self.last_message_time = None
+        将 UID 替换为 echo UID，并在原始呼号前添加前缀（截断至 12 字节），
+        其余头部字段和载荷保持不变。
 
-    def _replay_messages(self):
+        Args:
+            payload: 原始完整消息（至少包含 22 字节头部）
+
+        Returns:
+            bytearray: 修改头部后的完整消息
+
+        Raises:
+            ValueError: 如果数据长度不足 22 字节
+        """
+        raw_callsign = bytes(payload[FMORawHeader.CALLSIGN_OFFSET:FMORawHeader.HEADER_SIZE])
+
+        return rewrite_uid_callsign(payload, self._echo_uid, self._prefixed_callsign(raw_callsign))
+
+    def _build_prefixed_callsign(self, raw_callsign: bytes) -> bytes:
+        """
+        为原始呼号字段添加前缀
+
+        Args:
+            raw_callsign: 头部中 12 字节的原始呼号字段
+
+        Returns:
+            bytes: 前缀 + 原始呼号（去除尾部空字节），超过 12 字节时截断
+        """
+        return (self._prefix_bytes + raw_callsign.rstrip(b'\x00'))[:FMORawHeader.CALLSIGN_SIZE]
+
+    def _replay_messages(self, buffer: deque):
         """
         重放缓存中的所有消息
 
         对每个消息：
-        1. 解析原始头部获取呼号
-        2. 修改头部（UID 和呼号）
-        3. 发布到目标主题
+        1. 修改头部（UID 和呼号前缀）
+        2. 发布到目标主题
+
+        消息从队列头部逐个取出，已重放的消息随即释放，不会在重放期间一直占用内存。
+
+        Args:
+            buffer: 从缓存中取出的待重放消息队列（重放后为空）
         """
         success_count = 0
         fail_count = 0
-        publish_topic = self.config['topics']['publish']
+        total = len(buffer)
+        publish_topic = self._publish_topic
 
-        for i, msg_data in enumerate(self.message_buffer, 1):
-            try:
-                # 解析原始头部
-                original_header = FMORawHeader.from_bytes(msg_data)
-
-                # 构造新的呼号（添加前缀）
-                new_callsign = f"{self.config['echo']['callsign_prefix']}{original_header.callsign}"
+        # paho 的网络线程（loop_start）负责批量写出已入队的报文，
+        # 这里只需连续入队，无需在本线程触发额外的网络写操作
+        publish = self.mqtt_client.publish
+        popleft = buffer.popleft
 
+        for i in range(1, total + 1):
+            msg_data = popleft()
+            try:
                 # 修改头部
-                modified_msg = replace_header_in_stream(
-                    msg_data,
-                    uid=self.config['echo']['uid'],
-                    callsign=new_callsign
-                )
+                modified_msg = self._fast_rewrite(msg_data)
 
                 # 发布消息
-                result = self.mqtt_client.publish(publish_topic, modified_msg)
+                result = publish(publish_topic, modified_msg)
 
                 if result.rc == mqtt_client.MQTT_ERR_SUCCESS:
                     success_count += 1
-                    self.logger.debug(
-                        f"重放消息 [{i}/{len(self.message_buffer)}] - "
-                        f"原始: UID={original_header.uid}, 呼号='{original_header.callsign}' -> "
-                        f"修改后: UID={self.config['echo']['uid']}, 呼号='{new_callsign}'"
-                    )
+                    if self._debug_enabled:
+                        # 仅在调试时解析头部用于日志输出
+                        original_header = FMORawHeader.from_bytes(msg_data)
+                        new_header = FMORawHeader.from_bytes(modified_msg)
+                        self.logger.debug(
+                            f"重放消息 [{i}/{total}] - "
+                            f"原始: UID={original_header.uid}, 呼号='{original_header.callsign}' -> "
+                            f"修改后: UID={new_header.uid}, 呼号='{new_header.callsign}'"
+                        )
                 else:
                     fail_count += 1
                     self.logger.warning(f"发布消息 [{i}] 失败，返回码: {result.rc}")
@@ -318,7 +489,7 @@ class FMORepeaterService:
                 self.logger.error(f"重放消息 [{i}] 时出错: {e}", exc_info=True)
 
         self.logger.info(
-            f"重放完成 - 成功: {success_count}, 失败: {fail_count}, 总计: {len(self.message_buffer)}"
+            f"重放完成 - 成功: {success_count}, 失败: {fail_count}, 总计: {total}"
         )
 
     def run(self):
@@ -326,21 +497,32 @@ class FMORepeaterService:
         运行服务主循环
 
         主循环持续：
-        1. 检查超时
-        2. 等待一小段时间
-        3. 重复直到服务停止
+        1. 缓存为空时阻塞等待，直到收到新消息
+        2. 缓存非空时等待到超时截止时间
+        3. 检查超时，重复直到服务停止
         """
         self.running = True
         self.logger.info("FMO Repeater 服务已启动")
 
         try:
             while self.running:
+                with self.buffer_lock:
+                    deadline = self._deadline
+
+                if deadline is None:
+                    # 无缓存消息，等待新消息到达
+                    self._wake.wait()
+                else:
+                    # 等待到超时截止时间（期间可被唤醒）
+                    remaining_ns = deadline - time.monotonic_ns()
+                    if remaining_ns > 0:
+                        self._wake.wait(timeout=remaining_ns / 1_000_000_000)
+
+                self._wake.clear()
+
                 # 检查超时
                 self._check_timeout()
 
-                # 短暂休眠以避免 CPU 过度占用
-                time.sleep(self.check_interval)
-
         except KeyboardInterrupt:
             self.logger.info("接收到键盘中断")
         except Exception as e:
@@ -361,6 +543,7 @@ class FMORepeaterService:
             return
 
         self.running = False
+        self._wake.set()
         self.logger.info("正在停止 FMO Repeater 服务...")
 
         # 断开 MQTT
@@ -375,6 +558,19 @@ class FMORepeaterService:
 
         self.logger.info("FMO Repeater 服务已停止")
 
+        self.close()
+
+    def close(self):
+        """
+        停止本实例的日志后台线程，确保队列中的日志全部输出
+
+        无论服务是否运行过都可以调用，重复调用无副作用。
+        本实例的日志线程已被之后创建的实例替换时不做任何操作。
+        """
+        listener, self._log_listener = self._log_listener, None
+        if listener is not None and listener is _active_log_listener:
+            _stop_log_listener()
+
 
 def main():
     """
@@ -398,12 +594,7 @@ def main():
         service.connect()
 
         # 等待连接建立
-        timeout = 10
-        start_time = time.time()
-        while not service.connected and time.time() - start_time < timeout:
-            time.sleep(0.1)
-
-        if not service.connected:
+        if not service.wait_connected(timeout=10):
             service.logger.error("连接 MQTT 超时")
             sys.exit(1)
 
@@ -413,6 +604,9 @@ def main():
     except Exception as e:
         print(f"启动服务失败: {e}")
         sys.exit(1)
+    finally:
+        # 退出前输出队列中剩余的日志
+        service.close()
 
 
 if __name__ == '__main__':
@@ -12,10 +12,9 @@ FMO Repeater 服务主入口
 import os
 import sys
 import argparse
-import time
 
-from config import load_config, validate_config, save_default_config
-from fmo_repeater_service import FMORepeaterService
+# config 和 fmo_repeater_service 依赖 yaml、paho-mqtt，导入开销较大，
+# 仅在需要时于函数内部导入，stop/status 等操作无需加载
 from daemon import Daemon
 
 
@@ -26,6 +25,9 @@ def run_service(config_file: str = 'config.yaml'):
     Args:
         config_file: 配置文件路径
     """
+    from config import load_config, validate_config
+    from fmo_repeater_service import FMORepeaterService
+
     # 加载和验证配置
     try:
         config = load_config(config_file)
@@ -42,12 +44,7 @@ def run_service(config_file: str = 'config.yaml'):
         service.connect()
 
         # 等待连接建立
-        timeout = 10
-        start_time = time.time()
-        while not service.connected and time.time() - start_time < timeout:
-            time.sleep(0.1)
-
-        if not service.connected:
+        if not service.wait_connected(timeout=10):
             service.logger.error("连接 MQTT 超时")
             sys.exit(1)
 
@@ -59,6 +56,9 @@ def run_service(config_file: str = 'config.yaml'):
         import traceback
         traceback.print_exc()
         sys.exit(1)
+    finally:
+        # 退出前输出队列中剩余的日志
+        service.close()
 
 
 def main():
@@ -128,6 +128,8 @@ def main():
 
     # 生成默认配置文件
     if args.generate_config:
+        from config import save_default_config
+
         try:
             save_default_config(args.generate_config)
             print(f"默认配置已生成: {args.generate_config}")
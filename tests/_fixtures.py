@@ -0,0 +1,62 @@
+"""
+测试共用数据和辅助函数
+
+所有测试使用 demo.py 中相同的示例数据包（原始 UID: 441，呼号: "BD8BOJ"），
+原始二进制保存在 fixtures/sample_msg.bin 中，导入时读取一次并解析头部。
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fmo_header import FMORawHeader
+
+# 示例数据包（22 字节头部 + 载荷）
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'sample_msg.bin'), 'rb') as f:
+    TEST_MSG = f.read()
+
+# 示例数据包的头部和载荷
+# 载荷为 memoryview，与其他消息的载荷比较时无需复制
+TEST_HEADER = FMORawHeader.from_bytes(TEST_MSG)
+TEST_PAYLOAD = memoryview(TEST_MSG)[FMORawHeader.HEADER_SIZE:]
+
+
+class MockMQTTMessage:
+    """模拟 paho 的 MQTTMessage，只提供 payload 属性"""
+
+    __slots__ = ('payload',)
+
+    def __init__(self, payload):
+        self.payload = payload
+
+
+def make_tester():
+    """
+    创建测试辅助函数
+
+    计数器保存在闭包中，避免每次断言都访问全局变量；
+    每个测试的输出拼接后一次性写出。
+
+    Returns:
+        tuple: (test 函数, 返回 (通过数, 总数) 的统计函数)
+    """
+    counts = [0, 0]  # [总数, 通过数]
+    write = sys.stdout.write
+
+    def test(name, condition, details=""):
+        """测试辅助函数"""
+        counts[0] += 1
+        if condition:
+            counts[1] += 1
+            line = f"✅ 测试 {counts[0]}: {name}\n"
+        else:
+            line = f"❌ 测试 {counts[0]}: {name} - 失败\n"
+        if details:
+            line += f"   {details}\n"
+        write(line + "\n")
+
+    def tally():
+        return counts[1], counts[0]
+
+    return test, tally
@@ -0,0 +1,63 @@
+"""
+pytest 适配
+
+测试文件是独立脚本（在模块级执行测试、以退出码报告结果），不能被 pytest 直接导入收集。
+本文件让 `pytest tests/` 把每个测试脚本作为一个测试项运行，复用 run_all_tests.py 的方式：
+必需测试在当前解释器中运行，集成测试在独立进程中运行；退出码 2 视为跳过。
+"""
+
+import os
+
+import pytest
+
+from run_all_tests import TESTS, TEST_TIMEOUT, _TestTimeout, run_in_process, run_in_subprocess
+
+# 测试文件名 -> 测试信息
+_TESTS_BY_FILE = {test_info['file']: test_info for test_info in TESTS}
+
+# 项目根目录
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ScriptFailure(Exception):
+    """测试脚本以非零退出码结束"""
+
+
+def pytest_pycollect_makemodule(module_path, parent):
+    """用 TestScript 代替默认的模块收集，避免导入时直接执行测试脚本"""
+    if module_path.name in _TESTS_BY_FILE:
+        return TestScript.from_parent(parent, path=module_path)
+    return None
+
+
+class TestScript(pytest.File):
+    """测试脚本文件，包含一个运行整个脚本的测试项"""
+
+    def collect(self):
+        yield TestScriptItem.from_parent(self, name=self.path.stem)
+
+
+class TestScriptItem(pytest.Item):
+    """运行整个测试脚本的测试项"""
+
+    def runtest(self):
+        test_info = _TESTS_BY_FILE[self.path.name]
+        runner = run_in_subprocess if test_info.get('subprocess') else run_in_process
+
+        try:
+            returncode, stderr = runner(str(self.path), _PROJECT_ROOT)
+        except _TestTimeout:
+            raise ScriptFailure(f"{test_info['name']} 超时（{TEST_TIMEOUT} 秒）")
+
+        if returncode == 2:
+            pytest.skip(f"{test_info['name']} 被跳过")
+        if returncode != 0:
+            raise ScriptFailure(f"{test_info['name']} 失败，退出码: {returncode}\n{stderr}")
+
+    def repr_failure(self, excinfo):
+        if isinstance(excinfo.value, ScriptFailure):
+            return str(excinfo.value)
+        return super().repr_failure(excinfo)
+
+    def reportinfo(self):
+        return self.path, 0, _TESTS_BY_FILE[self.path.name]['name']
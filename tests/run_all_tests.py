@@ -5,11 +5,19 @@ FMO Echo 服务测试运行器
 运行所有测试并生成测试报告
 """
 
+import contextlib
+import io
+import runpy
+import signal
 import subprocess
 import sys
 import os
+import traceback
 from datetime import datetime
 
+# 单个测试的超时时间（秒）
+TEST_TIMEOUT = 60
+
 # 测试文件列表（按执行顺序）
 TESTS = [
     {
@@ -40,7 +48,8 @@ TESTS = [
         'name': '集成测试',
         'file': 'test_integration.py',
         'description': '端到端集成测试（需要 MQTT 服务器）',
-        'required': False
+        'required': False,
+        'subprocess': True  # 依赖网络，在独立进程中运行以便超时后强制终止
     }
 ]
 
@@ -60,10 +69,116 @@ def print_section(text):
     print("-" * 70)
     print()
 
+class _TestTimeout(BaseException):
+    """测试超时（继承 BaseException，避免被测试文件中的 except Exception 捕获）"""
+
+
+def run_in_process(test_path, project_root):
+    """
+    在当前解释器中运行测试文件，省去启动新解释器和重复导入依赖的开销
+
+    运行前后保存并恢复 sys.argv、sys.path、工作目录、信号处理器，
+    并卸载测试期间导入的项目模块，保证各测试之间互不影响。
+    测试的标准输出直接打印，只收集标准错误。
+
+    Args:
+        test_path: 测试文件路径
+        project_root: 项目根目录
+
+    Returns:
+        tuple: (退出码, 标准错误文本)
+    """
+    stderr = io.StringIO()
+
+    saved_argv = sys.argv
+    saved_path = list(sys.path)
+    saved_cwd = os.getcwd()
+    saved_modules = set(sys.modules)
+    saved_handlers = {sig: signal.getsignal(sig) for sig in (signal.SIGINT, signal.SIGTERM)}
+
+    # 使用 SIGALRM 实现超时（仅 Unix）
+    use_alarm = hasattr(signal, 'SIGALRM')
+    if use_alarm:
+        def on_timeout(signum, frame):
+            raise _TestTimeout()
+        saved_alarm_handler = signal.signal(signal.SIGALRM, on_timeout)
+        signal.alarm(TEST_TIMEOUT)
+
+    returncode = 0
+    try:
+        sys.argv = [test_path]
+        # 与直接运行脚本一致，将测试文件所在目录加入模块搜索路径
+        sys.path.insert(0, os.path.dirname(test_path))
+        os.chdir(project_root)
+        with contextlib.redirect_stderr(stderr):
+            try:
+                runpy.run_path(test_path, run_name='__main__')
+            except SystemExit as e:
+                if e.code is None:
+                    returncode = 0
+                elif isinstance(e.code, int):
+                    returncode = e.code
+                else:
+                    print(e.code, file=sys.stderr)
+                    returncode = 1
+            except Exception:
+                traceback.print_exc()
+                returncode = 1
+    finally:
+        if use_alarm:
+            signal.alarm(0)
+            signal.signal(signal.SIGALRM, saved_alarm_handler)
+        for sig, handler in saved_handlers.items():
+            signal.signal(sig, handler)
+        sys.argv = saved_argv
+        sys.path[:] = saved_path
+        os.chdir(saved_cwd)
+
+        # 卸载测试期间导入的项目模块，下一个测试重新导入干净的模块
+        for name in set(sys.modules) - saved_modules:
+            module_file = getattr(sys.modules[name], '__file__', None) or ''
+            if os.path.abspath(module_file).startswith(project_root + os.sep):
+                del sys.modules[name]
+
+    return returncode, stderr.getvalue()
+
+
+def run_in_subprocess(test_path, project_root):
+    """
+    在独立进程中运行测试文件
+
+    子进程直接继承标准输出，测试输出实时显示；只收集标准错误。
+
+    Args:
+        test_path: 测试文件路径
+        project_root: 项目根目录
+
+    Returns:
+        tuple: (退出码, 标准错误文本)
+    """
+    # 先刷新缓冲区，保证子进程输出出现在已打印内容之后
+    sys.stdout.flush()
+
+    try:
+        result = subprocess.run(
+            [sys.executable, test_path],
+            cwd=project_root,
+            stderr=subprocess.PIPE,
+            text=True,
+            timeout=TEST_TIMEOUT
+        )
+    except subprocess.TimeoutExpired:
+        raise _TestTimeout()
+
+    return result.returncode, result.stderr
+
+
 def run_test(test_info):
     """
     运行单个测试
 
+    测试默认在当前解释器中运行；标记为 subprocess 的测试在独立进程中运行。
+
     Args:
         test_info: 测试信息字典
 
@@ -84,31 +199,24 @@ def run_test(test_info):
 
     start_time = datetime.now()
 
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(test_path)))
+    runner = run_in_subprocess if test_info.get('subprocess') else run_in_process
+
     try:
         # 运行测试
-        result = subprocess.run(
-            [sys.executable, test_path],
-            cwd=os.path.dirname(os.path.dirname(test_path)),  # 项目根目录
-            capture_output=True,
-            text=True,
-            timeout=60  # 超时时间 60 秒
-        )
+        returncode, stderr = runner(test_path, project_root)
 
         end_time = datetime.now()
         elapsed = (end_time - start_time).total_seconds()
 
-        # 打印测试输出
-        if result.stdout:
-            print(result.stdout)
-
-        if result.stderr:
+        if stderr:
             print("错误输出:", file=sys.stderr)
-            print(result.stderr, file=sys.stderr)
+            print(stderr, file=sys.stderr)
 
         # 检查退出码
-        if result.returncode == 0:
+        if returncode == 0:
             return True, False, elapsed
-        elif result.returncode == 2:
+        elif returncode == 2:
             # 退出码 2 表示测试被跳过
             print(f"⚠️  {test_info['name']} 被跳过")
             return False, True, elapsed
@@ -116,9 +224,9 @@ def run_test(test_info):
             print(f"❌ {test_info['name']} 失败")
             return False, False, elapsed
 
-    except subprocess.TimeoutExpired:
+    except _TestTimeout:
         print(f"❌ {test_info['name']} 超时")
-        return False, False, 60.0
+        return False, False, float(TEST_TIMEOUT)
 
     except Exception as e:
         print(f"❌ 运行测试时出错: {e}")
@@ -5,36 +5,29 @@
 测试配置加载、合并和验证功能
 """
 
+import contextlib
 import sys
 import os
+from stat import S_IMODE
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from config import load_config, validate_config, deep_merge, DEFAULT_CONFIG
+from config import (
+    load_config, validate_config, deep_merge, default_config, DEFAULT_CONFIG, _parse_config_file
+)
 import tempfile
 import yaml
 
+from _fixtures import make_tester
+
+# 与 config.py 一致，优先使用 libyaml 的 C 实现
+_Dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
 print("=" * 60)
 print("配置管理测试")
 print("=" * 60)
 print()
 
-test_count = 0
-pass_count = 0
-
-def test(name, condition, details=""):
-    """测试辅助函数"""
-    global test_count, pass_count
-    test_count += 1
-    if condition:
-        pass_count += 1
-        print(f"✅ 测试 {test_count}: {name}")
-        if details:
-            print(f"   {details}")
-    else:
-        print(f"❌ 测试 {test_count}: {name} - 失败")
-        if details:
-            print(f"   {details}")
-    print()
+test, tally = make_tester()
 
 # ========== 测试 1: 默认配置 ==========
 print("--- 测试组 1: 默认配置 ---")
@@ -120,6 +113,18 @@ try:
         f"期望: 'new', 实际: '{merged['f']}'"
     )
 
+    test(
+        "基础字典未被修改",
+        base['b'] == {'c': 2, 'd': 3} and base['e'] == 'base' and 'f' not in base,
+        f"base={base}"
+    )
+
+    test(
+        "合并结果不与基础字典共享嵌套对象",
+        merged['b'] is not base['b'],
+        "嵌套字典已复制"
+    )
+
 except Exception as e:
     test("配置合并", False, f"异常: {e}")
 
@@ -139,7 +144,7 @@ try:
                 'timeout': 10.0
             }
         }
-        yaml.dump(temp_config, f)
+        yaml.dump(temp_config, f, Dumper=_Dumper)
         temp_file = f.name
 
     # 加载临时配置
@@ -169,16 +174,20 @@ try:
         f"username='{config['mqtt']['username']}'"
     )
 
-    # 清理临时文件
+    # 清理临时文件（含旁路缓存）
     os.unlink(temp_file)
+    # 旁路缓存写入失败（如目录只读）时不会生成缓存文件
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(temp_file + '.cache')
 
 except Exception as e:
     test("YAML 文件加载", False, f"异常: {e}")
     if 'temp_file' in locals():
-        try:
-            os.unlink(temp_file)
-        except:
-            pass
+        for path in (temp_file, temp_file + '.cache'):
+            try:
+                os.unlink(path)
+            except:
+                pass
 
 # ========== 测试 4: 配置验证 ==========
 print("--- 测试组 4: 配置验证 ---")
@@ -186,16 +195,91 @@ print()
 
 # 测试有效配置
 try:
-    valid_config = DEFAULT_CONFIG.copy()
+    valid_config = default_config()
     result = validate_config(valid_config)
     test(
         "有效配置验证通过",
         result == True,
         "默认配置应该是有效的"
     )
+
 except Exception as e:
     test("有效配置验证", False, f"异常: {e}")
 
+# 测试已验证配置合并无效值后重新检查
+try:
+    validate_config(deep_merge(valid_config, {'mqtt': {'port': 99999}}))
+    test("合并后的无效配置应抛出异常", False, "没有抛出预期的异常")
+except ValueError as e:
+    test("合并后的无效配置重新验证", True, f"异常: {str(e)[:50]}...")
+except Exception as e:
+    test("合并后的无效配置检测", False, f"意外异常: {e}")
+
+# 测试已验证配置被原地修改后重新检查
+try:
+    valid_config['echo']['uid'] = 'x'
+    validate_config(valid_config)
+    test("修改后的无效配置应抛出异常", False, "没有抛出预期的异常")
+except ValueError as e:
+    test("修改后的无效配置重新验证", True, f"异常: {str(e)[:50]}...")
+except Exception as e:
+    test("修改后的无效配置检测", False, f"意外异常: {e}")
+
+# 测试配置文件中的 __validated__ 键不影响验证
+try:
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as f:
+        yaml.dump({
+            '__validated__': True,
+            'mqtt': {'broker': '', 'port': 99999},
+            'echo': {'timeout': -5},
+        }, f, Dumper=_Dumper)
+        injected_file = f.name
+
+    validate_config(load_config(injected_file))
+    test("伪造验证标记检测", False, "应该抛出 ValueError")
+except ValueError as e:
+    test("配置文件中的 __validated__ 不能跳过验证", True, f"异常: {str(e)[:50]}...")
+except Exception as e:
+    test("伪造验证标记检测", False, f"意外异常: {e}")
+finally:
+    if 'injected_file' in locals():
+        for path in (injected_file, injected_file + '.cache'):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+# 测试默认配置只读
+try:
+    DEFAULT_CONFIG['mqtt']['broker'] = 'example.com'
+    test("默认配置应为只读", False, "修改默认配置没有抛出异常")
+except TypeError:
+    test(
+        "默认配置为只读",
+        DEFAULT_CONFIG['mqtt']['broker'] == 'localhost' and default_config()['mqtt']['broker'] == 'localhost',
+        "修改 DEFAULT_CONFIG 抛出 TypeError"
+    )
+
+# 测试只读默认配置可直接用于验证和合并
+try:
+    test(
+        "只读默认配置验证通过",
+        validate_config(DEFAULT_CONFIG) == True,
+        "可直接验证 DEFAULT_CONFIG"
+    )
+
+    merged_default = deep_merge(DEFAULT_CONFIG, {'mqtt': {'port': 1884}})
+    merged_default['echo']['blocked_uids'].append(1)
+    test(
+        "只读默认配置可作为合并基础",
+        type(merged_default['mqtt']) is dict and merged_default['mqtt']['port'] == 1884
+        and merged_default['mqtt']['broker'] == 'localhost'
+        and DEFAULT_CONFIG['mqtt']['port'] == 1883 and DEFAULT_CONFIG['echo']['blocked_uids'] == [],
+        f"port={merged_default['mqtt']['port']}, 嵌套字典类型={type(merged_default['mqtt']).__name__}"
+    )
+except Exception as e:
+    test("只读默认配置验证与合并", False, f"异常: {e}")
+
 # 测试缺少配置节
 try:
     invalid_config = {'mqtt': {}}  # 缺少其他必需节
@@ -208,7 +292,7 @@ except Exception as e:
 
 # 测试 MQTT broker 为空
 try:
-    invalid_config = DEFAULT_CONFIG.copy()
+    invalid_config = default_config()
     invalid_config['mqtt']['broker'] = ''
     validate_config(invalid_config)
     test("空 broker 应抛出异常", False, "没有抛出预期的异常")
@@ -219,7 +303,7 @@ except Exception as e:
 
 # 测试无效的端口号
 try:
-    invalid_config = DEFAULT_CONFIG.copy()
+    invalid_config = default_config()
     invalid_config['mqtt']['port'] = 99999  # 超出范围
     validate_config(invalid_config)
     test("无效端口应抛出异常", False, "没有抛出预期的异常")
@@ -230,7 +314,7 @@ except Exception as e:
 
 # 测试无效的超时时间
 try:
-    invalid_config = DEFAULT_CONFIG.copy()
+    invalid_config = default_config()
     invalid_config['echo']['timeout'] = -1  # 负数
     validate_config(invalid_config)
     test("负数超时应抛出异常", False, "没有抛出预期的异常")
@@ -241,7 +325,7 @@ except Exception as e:
 
 # 测试无效的日志级别
 try:
-    invalid_config = DEFAULT_CONFIG.copy()
+    invalid_config = default_config()
     invalid_config['logging']['level'] = 'INVALID'
     validate_config(invalid_config)
     test("无效日志级别应抛出异常", False, "没有抛出预期的异常")
@@ -252,7 +336,7 @@ except Exception as e:
 
 # 测试无效的 UID
 try:
-    invalid_config = DEFAULT_CONFIG.copy()
+    invalid_config = default_config()
     invalid_config['echo']['uid'] = 70000  # 超出 uint16 范围
     validate_config(invalid_config)
     test("无效 UID 应抛出异常", False, "没有抛出预期的异常")
@@ -261,7 +345,148 @@ except ValueError as e:
 except Exception as e:
     test("无效 UID 检测", False, f"意外异常: {e}")
 
+# 测试无效的最大缓存数
+try:
+    invalid_config = default_config()
+    invalid_config['echo']['max_buffer'] = 0
+    validate_config(invalid_config)
+    test("无效最大缓存数应抛出异常", False, "没有抛出预期的异常")
+except ValueError as e:
+    test("无效最大缓存数正确抛出异常", True, f"异常: {str(e)[:50]}...")
+except Exception as e:
+    test("无效最大缓存数检测", False, f"意外异常: {e}")
+
+# 测试布尔值不能作为整数配置项
+for section, key, value, label in (
+    ('mqtt', 'port', True, "端口"),
+    ('echo', 'blocked_uids', [True], "屏蔽 UID 列表"),
+):
+    try:
+        bool_config = default_config()
+        bool_config[section][key] = value
+        validate_config(bool_config)
+        test(f"{label}为布尔值应抛出异常", False, "没有抛出预期的异常")
+    except ValueError as e:
+        test(f"{label}为布尔值正确抛出异常", True, f"异常: {str(e)[:50]}...")
+    except Exception as e:
+        test(f"{label}为布尔值检测", False, f"意外异常: {e}")
+
+# 测试省略最大缓存数（使用默认值）
+try:
+    no_buffer_config = default_config()
+    del no_buffer_config['echo']['max_buffer']
+    test(
+        "省略最大缓存数时验证通过",
+        validate_config(no_buffer_config) == True,
+        "max_buffer 为可选项"
+    )
+except Exception as e:
+    test("省略最大缓存数", False, f"异常: {e}")
+
+# 测试 UNIX 域套接字配置
+try:
+    socket_config = default_config()
+    socket_config['mqtt']['socket_path'] = '/var/run/mosquitto.sock'
+    socket_config['mqtt']['broker'] = ''
+    test(
+        "配置 socket_path 时允许 broker 为空",
+        validate_config(socket_config) == True,
+        f"socket_path: {socket_config['mqtt']['socket_path']}"
+    )
+except Exception as e:
+    test("UNIX 域套接字配置", False, f"异常: {e}")
+
+try:
+    invalid_config = default_config()
+    invalid_config['mqtt']['socket_path'] = 123
+    validate_config(invalid_config)
+    test("无效 socket_path 应抛出异常", False, "没有抛出预期的异常")
+except ValueError as e:
+    test("无效 socket_path 正确抛出异常", True, f"异常: {str(e)[:50]}...")
+except Exception as e:
+    test("无效 socket_path 检测", False, f"意外异常: {e}")
+
+# ========== 测试 5: 配置缓存 ==========
+print("--- 测试组 5: 配置缓存 ---")
+print()
+
+try:
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as f:
+        yaml.dump({'echo': {'timeout': 7.0}}, f, Dumper=_Dumper)
+        temp_file = f.name
+
+    first = load_config(temp_file)
+    second = load_config(temp_file)
+
+    test(
+        "重复加载结果一致",
+        first == second,
+        f"timeout={second['echo']['timeout']}"
+    )
+
+    # 修改返回值不应影响缓存
+    first['echo']['timeout'] = 99.0
+    third = load_config(temp_file)
+
+    test(
+        "缓存内容不受调用方修改影响",
+        third['echo']['timeout'] == 7.0,
+        f"timeout={third['echo']['timeout']}"
+    )
+
+    # 文件更新后应重新解析
+    with open(temp_file, 'w') as f:
+        yaml.dump({'echo': {'timeout': 8.0}}, f, Dumper=_Dumper)
+    stat = os.stat(temp_file)
+    os.utime(temp_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    updated = load_config(temp_file)
+
+    test(
+        "文件修改后重新加载",
+        updated['echo']['timeout'] == 8.0,
+        f"timeout={updated['echo']['timeout']}"
+    )
+
+    test(
+        "生成旁路缓存文件",
+        os.path.exists(temp_file + '.cache'),
+        f"缓存文件: {temp_file}.cache"
+    )
+
+    config_mode = S_IMODE(os.stat(temp_file).st_mode)
+    sidecar_mode = S_IMODE(os.stat(temp_file + '.cache').st_mode)
+    test(
+        "旁路缓存文件权限与配置文件一致",
+        sidecar_mode == config_mode,
+        f"配置文件={oct(config_mode)}, 缓存文件={oct(sidecar_mode)}"
+    )
+
+    # 清空进程内缓存后，应从旁路缓存文件读取
+    _parse_config_file.cache_clear()
+    from_sidecar = load_config(temp_file)
+
+    test(
+        "从旁路缓存文件加载",
+        from_sidecar['echo']['timeout'] == 8.0,
+        f"timeout={from_sidecar['echo']['timeout']}"
+    )
+
+    os.unlink(temp_file)
+    # 旁路缓存写入失败（如目录只读）时不会生成缓存文件
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(temp_file + '.cache')
+
+except Exception as e:
+    test("配置缓存", False, f"异常: {e}")
+    if 'temp_file' in locals():
+        for path in (temp_file, temp_file + '.cache'):
+            try:
+                os.unlink(path)
+            except:
+                pass
+
 # ========== 测试总结 ==========
+pass_count, test_count = tally()
 print("=" * 60)
 print(f"测试总结: {pass_count}/{test_count} 通过")
 print("=" * 60)
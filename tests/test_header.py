@@ -9,8 +9,9 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from fmo_header import FMORawHeader, replace_header_in_stream
-import base64
+from fmo_header import (
+    FMORawHeader, peek_uid, replace_header_in_stream, rewrite_uid_callsign, rewrite_uid_callsign_inplace
+)
 
 print("=" * 60)
 print("FMO 头部处理测试")
@@ -18,25 +19,9 @@ print("=" * 60)
 print()
 
 # 使用 demo.py 中的测试消息
-test_msg = base64.b64decode("AQAAAAAAuQEAAEJEOEJPSgAAAAAAAIMzr++DM6/vmAEAAAEABxyQmgYAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAEAWAEAAAAAAlABPRQA4D0AABYZAABAPX///3fZESEIN40OABFymqqKwBCgYSIIECG/AAIriBGXPbkJiQgYG7p2mAyEESmginniKRCJqprrFzCKoBqiIyEXWMsIiMqDeKmACYiIk3eairgESZiiDYIKULiJWLEnjKkRMorKQbIvgYAFOKuZmbirZIgouYNhuwLIITW9gAgQAakAdim6qpmIABP/A0kBEQAAiJiicviZMbqxK5k3Ijm6qZqf8DcpoBiamSiIvEihhWipqZBymwiJtxoQq7NREJmZmJAAEBEBAQEBAAAAAIiImImKoQbAEqo6qFwJSwNLMBIAIbIYGcEMk4qoGwWpQbOa+JslmLuhkOQLESkTEYg+4CHZGAG6KflSAhIbsgH6KNEckZF6mJADYasQkhrYAqMzCONckpolqBiLwwo/wALJQmChixOKMPiIAhUAmf0V")
-
-test_count = 0
-pass_count = 0
-
-def test(name, condition, details=""):
-    """测试辅助函数"""
-    global test_count, pass_count
-    test_count += 1
-    if condition:
-        pass_count += 1
-        print(f"✅ 测试 {test_count}: {name}")
-        if details:
-            print(f"   {details}")
-    else:
-        print(f"❌ 测试 {test_count}: {name} - 失败")
-        if details:
-            print(f"   {details}")
-    print()
+from _fixtures import TEST_MSG as test_msg, TEST_PAYLOAD, make_tester
+
+test, tally = make_tester()
 
 # ========== 测试 1: 头部解析 ==========
 print("--- 测试组 1: 头部解析 ---")
@@ -92,6 +77,19 @@ try:
         f"类型: {type(serialized)}"
     )
 
+    # 在非零偏移处直接序列化到缓冲区，前后字节保持不变
+    offset = 5
+    buffer = bytearray(b'\xaa' * (offset + FMORawHeader.HEADER_SIZE + 3))
+    new_header.pack_into(buffer, offset)
+
+    test(
+        "pack_into 结果与 to_bytes 一致",
+        buffer[offset:offset + FMORawHeader.HEADER_SIZE] == serialized
+        and buffer[:offset] == b'\xaa' * offset
+        and buffer[offset + FMORawHeader.HEADER_SIZE:] == b'\xaa' * 3,
+        f"偏移={offset}, 写入 {FMORawHeader.HEADER_SIZE} 字节"
+    )
+
 except Exception as e:
     test("头部序列化", False, f"异常: {e}")
 
@@ -127,6 +125,31 @@ try:
         f"原始: '{original.callsign}', 恢复: '{recovered.callsign}'"
     )
 
+    # 修改呼号后重新序列化，应反映新的呼号
+    original.callsign = "ECHO2"
+    reserialized = FMORawHeader.from_bytes(original.to_bytes())
+
+    test(
+        "修改呼号后序列化结果更新",
+        reserialized.callsign == "ECHO2",
+        f"期望: 'ECHO2', 实际: '{reserialized.callsign}'"
+    )
+
+    test(
+        "呼号原始字节保持不变",
+        reserialized.callsign_raw == b"ECHO2".ljust(FMORawHeader.CALLSIGN_SIZE, b"\x00"),
+        f"原始字节: {reserialized.callsign_raw!r}"
+    )
+
+    # 以原始字节设置呼号
+    from_raw = FMORawHeader(version=1, uid=1, callsign=b"RE>ECHO")
+
+    test(
+        "以字节构造呼号",
+        from_raw.callsign == "RE>ECHO" and FMORawHeader.from_bytes(from_raw.to_bytes()).callsign == "RE>ECHO",
+        f"呼号: '{from_raw.callsign}'"
+    )
+
 except Exception as e:
     test("往返转换", False, f"异常: {e}")
 
@@ -177,6 +200,16 @@ try:
         f"UID={modified_header3.uid}, 呼号='{modified_header3.callsign}'"
     )
 
+    # 以字节形式指定呼号
+    modified_bytes = replace_header_in_stream(test_msg, callsign=b'AB')
+    modified_header4 = FMORawHeader.from_bytes(modified_bytes)
+
+    test(
+        "以字节形式修改呼号",
+        modified_header4.callsign == "AB" and modified_header4.callsign_raw == b'AB'.ljust(12, b'\x00'),
+        f"呼号='{modified_header4.callsign}'"
+    )
+
 except Exception as e:
     test("头部修改", False, f"异常: {e}")
 
@@ -196,8 +229,8 @@ try:
     )
 
     # 检查载荷部分是否完全相同
-    original_payload = test_msg[FMORawHeader.HEADER_SIZE:]
-    modified_payload = modified[FMORawHeader.HEADER_SIZE:]
+    original_payload = TEST_PAYLOAD
+    modified_payload = memoryview(modified)[FMORawHeader.HEADER_SIZE:]
 
     test(
         "载荷数据完全保留",
@@ -208,8 +241,48 @@ try:
 except Exception as e:
     test("载荷保留", False, f"异常: {e}")
 
-# ========== 测试 6: 边界条件 ==========
-print("--- 测试组 6: 边界条件测试 ---")
+# ========== 测试 6: 字节层面重写 UID 和呼号 ==========
+print("--- 测试组 6: 字节层面重写 UID 和呼号 ---")
+print()
+
+try:
+    rewritten = rewrite_uid_callsign(test_msg, 65535, b"RE>BD8BOJ")
+    expected = replace_header_in_stream(test_msg, uid=65535, callsign="RE>BD8BOJ")
+
+    test(
+        "与 replace_header_in_stream 结果一致",
+        rewritten == expected,
+        f"长度: {len(rewritten)}"
+    )
+
+    truncated = FMORawHeader.from_bytes(rewrite_uid_callsign(test_msg, 1, b"RE>ABCDEFGHIJKL"))
+
+    test(
+        "超长呼号被截断至 12 字节",
+        truncated.callsign == "RE>ABCDEFGHI",
+        f"呼号: '{truncated.callsign}'"
+    )
+
+    inplace = bytearray(test_msg)
+    rewrite_uid_callsign_inplace(inplace, 65535, b"RE>BD8BOJ")
+
+    test(
+        "原地重写与复制重写结果一致",
+        inplace == rewritten,
+        f"长度: {len(inplace)}"
+    )
+
+    test(
+        "peek_uid 直接读取 UID",
+        peek_uid(test_msg) == 441 and peek_uid(rewritten) == 65535,
+        f"原始 UID: {peek_uid(test_msg)}, 重写后 UID: {peek_uid(rewritten)}"
+    )
+
+except Exception as e:
+    test("字节层面重写", False, f"异常: {e}")
+
+# ========== 测试 7: 边界条件 ==========
+print("--- 测试组 7: 边界条件测试 ---")
 print()
 
 try:
@@ -248,6 +321,7 @@ except Exception as e:
     test("边界条件测试", False, f"意外异常: {e}")
 
 # ========== 测试总结 ==========
+pass_count, test_count = tally()
 print("=" * 60)
 print(f"测试总结: {pass_count}/{test_count} 通过")
 print("=" * 60)
@@ -14,7 +14,7 @@ from fmo_repeater_service import FMORepeaterService
 from fmo_header import FMORawHeader, replace_header_in_stream
 from paho.mqtt import client as mqtt_client
 import paho.mqtt.enums
-import base64
+from _fixtures import TEST_MSG as test_msg, TEST_HEADER, TEST_PAYLOAD
 import time
 import threading
 
@@ -23,9 +23,6 @@ print("FMO Echo 服务集成测试")
 print("=" * 60)
 print()
 
-# 使用 demo.py 中的测试消息
-test_msg = base64.b64decode("AQAAAAAAuQEAAEJEOEJPSgAAAAAAAIMzr++DM6/vmAEAAAEABxyQmgYAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAEAWAEAAAAAAlABPRQA4D0AABYZAABAPX///3fZESEIN40OABFymqqKwBCgYSIIECG/AAIriBGXPbkJiQgYG7p2mAyEESmginniKRCJqprrFzCKoBqiIyEXWMsIiMqDeKmACYiIk3eairgESZiiDYIKULiJWLEnjKkRMorKQbIvgYAFOKuZmbirZIgouYNhuwLIITW9gAgQAakAdim6qpmIABP/A0kBEQAAiJiicviZMbqxK5k3Ijm6qZqf8DcpoBiamSiIvEihhWipqZBymwiJtxoQq7NREJmZmJAAEBEBAQEBAAAAAIiImImKoQbAEqo6qFwJSwNLMBIAIbIYGcEMk4qoGwWpQbOa+JslmLuhkOQLESkTEYg+4CHZGAG6KflSAhIbsgH6KNEckZF6mJADYasQkhrYAqMzCONckpolqBiLwwo/wALJQmChixOKMPiIAhUAmf0V")
-
 test_count = 0
 pass_count = 0
 
@@ -88,17 +85,16 @@ try:
     service.connect()
 
     # 等待连接建立
-    timeout = 10
-    start_time = time.time()
-    while not service.connected and time.time() - start_time < timeout:
-        time.sleep(0.1)
-
     test(
         "MQTT 连接建立成功",
-        service.connected,
+        service.wait_connected(timeout=10),
         f"Broker: {config['mqtt']['broker']}:{config['mqtt']['port']}"
     )
 
+    # 在后台线程运行服务主循环，负责超时检测和重放
+    service_thread = threading.Thread(target=service.run, daemon=True)
+    service_thread.start()
+
 except Exception as e:
     test("服务启动和连接", False, f"异常: {e}")
     if service:
@@ -137,66 +133,83 @@ print("--- 测试组 3: 消息接收和缓存 ---")
 print()
 
 received_messages = []
-
-# 创建监听客户端
-def create_listener():
-    """创建监听客户端以捕获重放的消息"""
-    listener = mqtt_client.Client(
+message_received = threading.Event()  # 辅助客户端每收到一条消息置位
+aux_connected = threading.Event()  # 辅助客户端连接建立时置位
+
+
+def wait_for(event, condition, timeout):
+    """
+    等待条件成立，事件置位时重新检查条件，无需固定间隔轮询
+
+    Args:
+        event: 条件可能发生变化时置位的事件
+        condition: 返回条件是否成立的函数
+        timeout: 最长等待时间（秒）
+
+    Returns:
+        bool: 超时前条件成立返回 True，否则返回 False
+    """
+    deadline = time.monotonic() + timeout
+    while not condition():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        event.wait(remaining)
+        event.clear()
+    return True
+
+
+# 创建辅助客户端
+def create_aux_client():
+    """
+    创建辅助客户端
+
+    同一个连接既用于发送测试消息，也用于监听捕获重放的消息，
+    整个测试只与代理握手一次。
+    """
+    aux_client = mqtt_client.Client(
         paho.mqtt.enums.CallbackAPIVersion.VERSION2,
-        "test_listener"
+        "test_aux_client"
     )
 
+    def on_connect(client, userdata, flags, reason_code, properties):
+        if reason_code == 0:
+            aux_connected.set()
+
     def on_message(client, userdata, msg):
         received_messages.append(msg.payload)
+        message_received.set()
 
-    listener.on_message = on_message
+    aux_client.on_connect = on_connect
+    aux_client.on_message = on_message
 
     if config['mqtt']['username']:
-        listener.username_pw_set(
+        aux_client.username_pw_set(
             config['mqtt']['username'],
             config['mqtt']['password']
         )
 
-    listener.connect(
+    aux_client.connect(
         config['mqtt']['broker'],
         config['mqtt']['port']
     )
 
-    listener.subscribe(config['topics']['publish'])
-    listener.loop_start()
+    aux_client.subscribe(config['topics']['publish'])
+    aux_client.loop_start()
 
-    return listener
+    return aux_client
 
-listener = create_listener()
-time.sleep(1)  # 等待监听器准备好
+aux_client = create_aux_client()
+aux_connected.wait(timeout=10)  # 等待辅助客户端准备好
 
 try:
-    # 发送测试消息
-    publisher = mqtt_client.Client(
-        paho.mqtt.enums.CallbackAPIVersion.VERSION2,
-        "test_publisher"
-    )
-
-    if config['mqtt']['username']:
-        publisher.username_pw_set(
-            config['mqtt']['username'],
-            config['mqtt']['password']
-        )
-
-    publisher.connect(
-        config['mqtt']['broker'],
-        config['mqtt']['port']
-    )
-
     # 发送 3 个测试消息
+    service._message_cached.clear()
     for i in range(3):
-        publisher.publish(config['topics']['subscribe'], test_msg)
-        time.sleep(0.2)
-
-    publisher.disconnect()
+        aux_client.publish(config['topics']['subscribe'], test_msg)
 
     # 等待消息被服务接收和缓存
-    time.sleep(1)
+    wait_for(service._message_cached, lambda: len(service.message_buffer) == 3, timeout=2)
 
     test(
         "消息成功缓存",
@@ -215,9 +228,9 @@ try:
     # 记录当前接收到的消息数量
     initial_received_count = len(received_messages)
 
-    # 等待超时触发重放（配置为 3 秒）
+    # 等待超时触发重放（配置为 3 秒），重放完成后立即返回
     print(f"   等待超时触发（{config['echo']['timeout']}秒）...")
-    time.sleep(config['echo']['timeout'] + 1)
+    service._replay_done.wait(timeout=config['echo']['timeout'] + 2)
 
     test(
         "超时后缓存已清空",
@@ -226,7 +239,7 @@ try:
     )
 
     # 等待重放的消息被接收
-    time.sleep(2)
+    wait_for(message_received, lambda: len(received_messages) - initial_received_count >= 3, timeout=2)
 
     replayed_count = len(received_messages) - initial_received_count
 
@@ -248,7 +261,7 @@ try:
         # 验证第一个重放的消息
         replayed_msg = received_messages[-1]  # 最后一个接收到的消息
         replayed_header = FMORawHeader.from_bytes(replayed_msg)
-        original_header = FMORawHeader.from_bytes(test_msg)
+        original_header = TEST_HEADER
 
         test(
             "重放消息 UID 修改为 65535",
@@ -264,8 +277,8 @@ try:
         )
 
         # 验证载荷
-        original_payload = test_msg[FMORawHeader.HEADER_SIZE:]
-        replayed_payload = replayed_msg[FMORawHeader.HEADER_SIZE:]
+        original_payload = TEST_PAYLOAD
+        replayed_payload = memoryview(replayed_msg)[FMORawHeader.HEADER_SIZE:]
 
         test(
             "载荷数据完全保留",
@@ -284,32 +297,16 @@ print("--- 测试组 6: 重放循环防护 ---")
 print()
 
 try:
-    # 清空接收记录
+    # 清空接收记录和重放完成标记
     received_messages.clear()
+    service._replay_done.clear()
 
     # 手动发送一个重放消息（UID=65535）
     replay_msg = replace_header_in_stream(test_msg, uid=65535, callsign="RE>TEST")
 
-    publisher2 = mqtt_client.Client(
-        paho.mqtt.enums.CallbackAPIVersion.VERSION2,
-        "test_publisher2"
-    )
-
-    if config['mqtt']['username']:
-        publisher2.username_pw_set(
-            config['mqtt']['username'],
-            config['mqtt']['password']
-        )
-
-    publisher2.connect(
-        config['mqtt']['broker'],
-        config['mqtt']['port']
-    )
-
     # 发送重放消息
-    publisher2.publish(config['topics']['subscribe'], replay_msg)
+    aux_client.publish(config['topics']['subscribe'], replay_msg)
     time.sleep(1)
-    publisher2.disconnect()
 
     test(
         "重放消息未被缓存",
@@ -317,12 +314,15 @@ try:
         "UID=65535 的消息被正确过滤"
     )
 
+    # 订阅与发布主题相同时，辅助客户端也会收到上面发送的消息，先清空再检查重放
+    received_messages.clear()
+
     # 等待超时（不应有新的重放）
-    time.sleep(config['echo']['timeout'] + 1)
+    replayed_again = service._replay_done.wait(timeout=config['echo']['timeout'] + 1)
 
     test(
         "未触发新的重放循环",
-        len(received_messages) == 0,
+        not replayed_again and len(received_messages) == 0,
         "没有接收到新的重放消息"
     )
 
@@ -334,10 +334,10 @@ print("--- 清理资源 ---")
 print()
 
 try:
-    listener.loop_stop()
-    listener.disconnect()
+    aux_client.loop_stop()
+    aux_client.disconnect()
     service.stop()
-    time.sleep(1)
+    service_thread.join(timeout=5)
 
     print("✅ 资源清理完成")
     print()
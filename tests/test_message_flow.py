@@ -5,24 +5,24 @@
 测试消息缓存、超时检测和重放功能
 """
 
+import copy
 import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from fmo_header import FMORawHeader, replace_header_in_stream
 from fmo_repeater_service import FMORepeaterService
-import base64
+from _fixtures import TEST_MSG as test_msg, TEST_HEADER, TEST_PAYLOAD, MockMQTTMessage
+import subprocess
 import time
 import threading
+from collections import deque
 
 print("=" * 60)
 print("消息流程测试")
 print("=" * 60)
 print()
 
-# 使用 demo.py 中的测试消息
-test_msg = base64.b64decode("AQAAAAAAuQEAAEJEOEJPSgAAAAAAAIMzr++DM6/vmAEAAAEABxyQmgYAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAEAWAEAAAAAAlABPRQA4D0AABYZAABAPX///3fZESEIN40OABFymqqKwBCgYSIIECG/AAIriBGXPbkJiQgYG7p2mAyEESmginniKRCJqprrFzCKoBqiIyEXWMsIiMqDeKmACYiIk3eairgESZiiDYIKULiJWLEnjKkRMorKQbIvgYAFOKuZmbirZIgouYNhuwLIITW9gAgQAakAdim6qpmIABP/A0kBEQAAiJiicviZMbqxK5k3Ijm6qZqf8DcpoBiamSiIvEihhWipqZBymwiJtxoQq7NREJmZmJAAEBEBAQEBAAAAAIiImImKoQbAEqo6qFwJSwNLMBIAIbIYGcEMk4qoGwWpQbOa+JslmLuhkOQLESkTEYg+4CHZGAG6KflSAhIbsgH6KNEckZF6mJADYasQkhrYAqMzCONckpolqBiLwwo/wALJQmChixOKMPiIAhUAmf0V")
-
 test_count = 0
 pass_count = 0
 
@@ -89,9 +89,9 @@ try:
     )
 
     test(
-        "初始无最后消息时间",
-        service.last_message_time is None,
-        "last_message_time=None"
+        "初始无超时截止时间",
+        service._deadline is None,
+        "_deadline=None"
     )
 
 except Exception as e:
@@ -102,12 +102,7 @@ print("--- 测试组 2: 消息缓存机制 ---")
 print()
 
 try:
-    # 模拟接收消息（不使用实际 MQTT）
-    class MockMQTTMessage:
-        def __init__(self, payload):
-            self.payload = payload
-
-    # 模拟接收第一个消息
+    # 模拟接收第一个消息（不使用实际 MQTT）
     mock_msg = MockMQTTMessage(test_msg)
     service._on_message(None, None, mock_msg)
 
@@ -118,12 +113,12 @@ try:
     )
 
     test(
-        "设置了最后消息时间",
-        service.last_message_time is not None,
-        f"时间戳={service.last_message_time}"
+        "设置了超时截止时间",
+        service._deadline is not None,
+        f"截止时间={service._deadline}"
     )
 
-    first_time = service.last_message_time
+    first_deadline = service._deadline
 
     # 短暂延迟后模拟接收第二个消息
     time.sleep(0.1)
@@ -136,9 +131,9 @@ try:
     )
 
     test(
-        "最后消息时间已更新",
-        service.last_message_time > first_time,
-        f"新时间={service.last_message_time}"
+        "超时截止时间已延后",
+        service._deadline > first_deadline,
+        f"新截止时间={service._deadline}"
     )
 
 except Exception as e:
@@ -173,6 +168,20 @@ try:
         f"UID={replay_header.uid}"
     )
 
+    # 配置额外屏蔽的 UID（原始消息 UID=441）
+    blocked_config = copy.deepcopy(test_config)
+    blocked_config['echo']['blocked_uids'] = [441]
+    blocked_service = FMORepeaterService(blocked_config)
+    blocked_service._on_payload(test_msg)
+    blocked_service._on_payload(replay_msg)
+    blocked_service._on_payload(replace_header_in_stream(test_msg, uid=1))
+
+    test(
+        "屏蔽 UID 和 Echo UID 的消息均被过滤",
+        len(blocked_service.message_buffer) == 1,
+        f"缓存大小={len(blocked_service.message_buffer)}（仅 UID=1 的消息）"
+    )
+
 except Exception as e:
     test("UID 过滤", False, f"异常: {e}")
 
@@ -183,8 +192,8 @@ print()
 try:
     # 重置缓存和时间
     with service.buffer_lock:
-        service.message_buffer = [test_msg]
-        service.last_message_time = time.time()
+        service.message_buffer = deque([test_msg], maxlen=service._max_buffer)
+        service._deadline = time.monotonic_ns() + service._timeout_ns
 
     # 立即检查超时（不应触发）
     service._check_timeout()
@@ -204,24 +213,27 @@ print()
 
 try:
     # 创建模拟 MQTT 客户端以避免发布错误
+    class MockResult:
+        rc = 0  # MQTT_ERR_SUCCESS
+
+    # 所有发布共用同一个结果对象
+    publish_ok = MockResult()
+
     class MockMQTTClient:
         def __init__(self):
-            self.published = []
+            self.published = deque()
 
         def publish(self, topic, payload):
             self.published.append((topic, payload))
-            # 返回模拟结果对象
-            class MockResult:
-                rc = 0  # MQTT_ERR_SUCCESS
-            return MockResult()
+            return publish_ok
 
     # 替换为模拟客户端
     service.mqtt_client = MockMQTTClient()
 
     # 设置超时前的消息
     with service.buffer_lock:
-        service.message_buffer = [test_msg, test_msg]
-        service.last_message_time = time.time() - 5.0  # 5秒前
+        service.message_buffer = deque([test_msg, test_msg], maxlen=service._max_buffer)
+        service._deadline = time.monotonic_ns() - 5_000_000_000  # 5秒前已超时
 
     original_buffer_size = len(service.message_buffer)
 
@@ -235,9 +247,9 @@ try:
     )
 
     test(
-        "超时后重置最后消息时间",
-        service.last_message_time is None,
-        "last_message_time=None"
+        "超时后重置超时截止时间",
+        service._deadline is None,
+        "_deadline=None"
     )
 
     test(
@@ -246,6 +258,13 @@ try:
         f"发布数量={len(service.mqtt_client.published)}"
     )
 
+    cache_info = service._prefixed_callsign.cache_info()
+    test(
+        "相同呼号复用缓存的前缀呼号",
+        cache_info.misses == 1 and cache_info.hits == 1,
+        f"命中={cache_info.hits}, 未命中={cache_info.misses}"
+    )
+
 except Exception as e:
     test("超时检测（已超时）", False, f"异常: {e}")
 
@@ -259,7 +278,7 @@ try:
         published_topic, published_payload = service.mqtt_client.published[0]
 
         # 解析原始和发布的头部
-        original_header = FMORawHeader.from_bytes(test_msg)
+        original_header = TEST_HEADER
         published_header = FMORawHeader.from_bytes(published_payload)
 
         test(
@@ -282,8 +301,8 @@ try:
         )
 
         # 验证载荷未改变
-        original_payload = test_msg[FMORawHeader.HEADER_SIZE:]
-        published_payload_data = published_payload[FMORawHeader.HEADER_SIZE:]
+        original_payload = TEST_PAYLOAD
+        published_payload_data = memoryview(published_payload)[FMORawHeader.HEADER_SIZE:]
 
         test(
             "载荷数据完全保留",
@@ -300,12 +319,12 @@ print()
 
 try:
     # 重置发布记录
-    service.mqtt_client.published = []
+    service.mqtt_client.published.clear()
 
     # 设置空缓存但超时
     with service.buffer_lock:
-        service.message_buffer = []
-        service.last_message_time = time.time() - 5.0
+        service.message_buffer.clear()
+        service._deadline = time.monotonic_ns() - 5_000_000_000
 
     service._check_timeout()
 
@@ -317,8 +336,8 @@ try:
 
     test(
         "超时后仍重置状态",
-        service.last_message_time is None,
-        "last_message_time=None"
+        service._deadline is None,
+        "_deadline=None"
     )
 
 except Exception as e:
@@ -331,14 +350,13 @@ print()
 try:
     # 重置服务状态
     with service.buffer_lock:
-        service.message_buffer = []
-        service.last_message_time = None
+        service.message_buffer.clear()
+        service._deadline = None
 
     # 创建多个线程同时添加消息
     def add_messages():
         for _ in range(10):
-            mock_msg = MockMQTTMessage(test_msg)
-            service._on_message(None, None, mock_msg)
+            service._on_payload(test_msg)
 
     threads = []
     for _ in range(5):
@@ -359,6 +377,227 @@ try:
 except Exception as e:
     test("线程安全", False, f"异常: {e}")
 
+# ========== 测试 9: 日志后台线程 ==========
+print("--- 测试组 9: 日志后台线程 ---")
+print()
+
+try:
+    # 服务未运行时记录错误后立即 sys.exit，日志仍应输出（在独立进程中验证）
+    exit_script = (
+        "import copy, sys\n"
+        "from fmo_repeater_service import FMORepeaterService\n"
+        f"config = copy.deepcopy({test_config!r})\n"
+        "config['logging']['console'] = True\n"
+        "service = FMORepeaterService(config)\n"
+        "service.logger.error('退出前的错误日志')\n"
+        "sys.exit(1)\n"
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', exit_script],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True, text=True, timeout=30
+    )
+
+    test(
+        "sys.exit 前记录的日志被输出",
+        result.returncode == 1 and '退出前的错误日志' in result.stderr,
+        f"退出码={result.returncode}, stderr={result.stderr.strip()[-80:]!r}"
+    )
+
+    # 重复创建服务实例不会遗留日志线程
+    listener_config = copy.deepcopy(test_config)
+    listener_config['logging']['console'] = True
+    before = threading.active_count()
+    listener_services = [FMORepeaterService(listener_config) for _ in range(5)]
+
+    test(
+        "重复创建实例只保留一个日志线程",
+        threading.active_count() == before + 1,
+        f"创建前线程数={before}, 创建后={threading.active_count()}"
+    )
+
+    for listener_service in listener_services:
+        listener_service.close()
+
+    test(
+        "close() 停止日志线程",
+        threading.active_count() == before,
+        f"线程数={threading.active_count()}"
+    )
+
+except Exception as e:
+    test("日志后台线程", False, f"异常: {e}")
+
+# ========== 测试 10: 主循环 ==========
+print("--- 测试组 10: 主循环（run / stop）---")
+print()
+
+try:
+    class MockLoopMQTTClient(MockMQTTClient):
+        """供 stop() 调用的模拟客户端，记录网络循环是否已停止"""
+
+        def __init__(self):
+            super().__init__()
+            self.stopped = False
+
+        def loop_stop(self):
+            self.stopped = True
+
+        def disconnect(self):
+            pass
+
+    loop_config = copy.deepcopy(test_config)
+    loop_config['echo']['timeout'] = 0.3
+    loop_service = FMORepeaterService(loop_config)
+    loop_service.mqtt_client = MockLoopMQTTClient()
+
+    loop_thread = threading.Thread(target=loop_service.run, daemon=True)
+    loop_thread.start()
+
+    # 第一批消息：最后一个消息后经过超时时间重放一次
+    for _ in range(3):
+        loop_service._on_payload(test_msg)
+    burst_end = time.monotonic()
+    replayed = loop_service._replay_done.wait(timeout=5)
+    elapsed = time.monotonic() - burst_end
+
+    test(
+        "第一批消息在超时后重放",
+        replayed and len(loop_service.mqtt_client.published) == 3 and elapsed >= 0.3 * 0.9,
+        f"重放数量={len(loop_service.mqtt_client.published)}, 距最后一个消息={elapsed:.2f}秒"
+    )
+
+    # 空闲一段时间后的第二批消息再次重放，且第一批不会被重复重放
+    loop_service._replay_done.clear()
+    time.sleep(0.5)
+    idle_count = len(loop_service.mqtt_client.published)
+    for _ in range(2):
+        loop_service._on_payload(test_msg)
+    replayed = loop_service._replay_done.wait(timeout=5)
+
+    test(
+        "空闲后的第二批消息再次重放",
+        replayed and idle_count == 3 and len(loop_service.mqtt_client.published) == 5,
+        f"空闲期间发布数={idle_count}, 总发布数={len(loop_service.mqtt_client.published)}"
+    )
+
+    # stop() 唤醒阻塞等待中的主循环，线程应及时退出
+    stop_start = time.monotonic()
+    loop_service.stop()
+    loop_thread.join(timeout=2)
+    stop_elapsed = time.monotonic() - stop_start
+
+    test(
+        "stop() 后主循环线程及时退出",
+        not loop_thread.is_alive() and loop_service.mqtt_client.stopped and stop_elapsed < 1,
+        f"退出耗时={stop_elapsed:.3f}秒"
+    )
+
+except Exception as e:
+    test("主循环", False, f"异常: {e}")
+
+# ========== 测试 11: UNIX 域套接字连接 ==========
+print("--- 测试组 11: UNIX 域套接字连接 ---")
+print()
+
+try:
+    import types
+    import fmo_repeater_service
+
+    class RecordingClient:
+        """记录构造参数和 connect 参数的模拟 paho 客户端"""
+
+        instances = []
+
+        def __init__(self, callback_api_version, client_id, transport='tcp'):
+            self.transport = transport
+            self.connect_args = None
+            RecordingClient.instances.append(self)
+
+        def connect(self, host, port, keepalive):
+            self.connect_args = (host, port, keepalive)
+
+        def loop_start(self):
+            pass
+
+    socket_config = copy.deepcopy(test_config)
+    socket_config['mqtt']['socket_path'] = '/tmp/fmo_test_mqtt.sock'
+    socket_config['mqtt']['port'] = 0  # 使用 UNIX 域套接字时端口被忽略
+    socket_service = FMORepeaterService(socket_config)
+
+    original_mqtt_client = fmo_repeater_service.mqtt_client
+    fmo_repeater_service.mqtt_client = types.SimpleNamespace(Client=RecordingClient)
+    try:
+        socket_service.connect()
+    finally:
+        fmo_repeater_service.mqtt_client = original_mqtt_client
+
+    socket_client = RecordingClient.instances[-1]
+    test(
+        "UNIX 域套接字连接忽略配置中的端口",
+        socket_client.transport == 'unix'
+        and socket_client.connect_args[:2] == ('/tmp/fmo_test_mqtt.sock', fmo_repeater_service._UNIX_SOCKET_PORT),
+        f"transport={socket_client.transport}, connect={socket_client.connect_args}"
+    )
+
+except Exception as e:
+    test("UNIX 域套接字连接", False, f"异常: {e}")
+
+# ========== 测试 12: 缓存上限 ==========
+print("--- 测试组 12: 缓存上限 ---")
+print()
+
+try:
+    import logging
+
+    class ListHandler(logging.Handler):
+        """收集日志记录的处理器"""
+
+        def __init__(self):
+            super().__init__()
+            self.records = []
+
+        def emit(self, record):
+            self.records.append(record)
+
+    limit_config = copy.deepcopy(test_config)
+    limit_config['echo']['max_buffer'] = 3
+    limit_service = FMORepeaterService(limit_config)
+    limit_service.mqtt_client = MockMQTTClient()
+    warnings = ListHandler()
+    limit_service.logger.addHandler(warnings)
+
+    def fill_and_replay(count):
+        """缓存 count 个消息后立即触发重放，返回 (重放数量, 警告消息列表)"""
+        warnings.records.clear()
+        limit_service.mqtt_client.published.clear()
+        for _ in range(count):
+            limit_service._on_payload(test_msg)
+        with limit_service.buffer_lock:
+            limit_service._deadline = time.monotonic_ns() - 1
+        limit_service._check_timeout()
+        messages = [r.getMessage() for r in warnings.records if r.levelno == logging.WARNING]
+        return len(limit_service.mqtt_client.published), messages
+
+    published_count, warning_messages = fill_and_replay(3)
+    test(
+        "恰好达到上限时不报告丢弃",
+        published_count == 3 and not warning_messages,
+        f"重放数量={published_count}, 警告={warning_messages}"
+    )
+
+    published_count, warning_messages = fill_and_replay(5)
+    test(
+        "超出上限时报告实际丢弃数量",
+        published_count == 3 and len(warning_messages) == 1 and '丢弃了 2 个' in warning_messages[0],
+        f"重放数量={published_count}, 警告={warning_messages}"
+    )
+
+    limit_service.logger.removeHandler(warnings)
+
+except Exception as e:
+    test("缓存上限", False, f"异常: {e}")
+
 # ========== 测试总结 ==========
 print("=" * 60)
 print(f"测试总结: {pass_count}/{test_count} 通过")